@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+
+class AgentCache:
+    # LRU of compiled agent graphs keyed by (user_id, index identity), so a
+    # warm request skips create_react_agent and the retriever tool setup.
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple, build):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Build outside the lock, compiling a graph should not stall other users
+        agent = build()
+        with self._lock:
+            # Drop entries built for an older index identity of the same user
+            for stale in [k for k in self._entries if k[0] == key[0] and k != key]:
+                del self._entries[stale]
+            self._entries[key] = agent
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return agent
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_id]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
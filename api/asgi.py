@@ -0,0 +1,149 @@
+import os
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import StreamingResponse, JSONResponse, FileResponse, Response
+from starlette.routing import Route
+from api.server import ainvoke_stream, get_pending_edits, get_ingest_status, get_conversation_stats, save_current_docx, download_etag, get_metrics
+from api.upload_store import save_upload
+
+# Async serving mode with the same endpoints as api/index.py:
+#   uvicorn api.asgi:app --host 0.0.0.0 --port 5000
+
+UPLOAD_FOLDER = "data"
+os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+MAX_STREAMS = int(os.environ.get("ASGI_MAX_STREAMS", "500"))
+STREAM_WAIT_SECONDS = float(os.environ.get("ASGI_STREAM_WAIT_SECONDS", "30"))
+
+# OCR, python-docx, SQLite and the ingestion wait run here instead of on the event loop
+blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("ASGI_BLOCKING_WORKERS", "32")),
+    thread_name_prefix="asgi-blocking",
+)
+stream_slots = asyncio.Semaphore(MAX_STREAMS)
+
+async def _run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(blocking_executor, fn, *args)
+
+async def chat(request):
+    form = await request.form()
+    question = form.get("question")
+    user_id = form.get("user_id")
+    file = form.get("file")
+    start = form.get("doc_start")
+    end = form.get("doc_end")
+    content_req = form.get("doc_content")
+    wait_for_index = form.get("wait_for_index", os.environ.get("INGEST_WAIT", "1")) not in ("0", "false")
+    content = None
+    if isinstance(content_req, str):
+        content = json.loads(content_req)
+    file_path = ""
+    file_hash = None
+    source = ""
+    if file and getattr(file, "filename", None):
+        source = file.filename
+        file_path, file_hash = await _run_blocking(save_upload, file.file, user_id, file.filename)
+
+    async def stream():
+        try:
+            await asyncio.wait_for(stream_slots.acquire(), timeout=STREAM_WAIT_SECONDS)
+        except asyncio.TimeoutError:
+            yield "The server is busy, please try again shortly."
+            return
+
+        agen = ainvoke_stream(
+            question=question, user_id=user_id, file_path=file_path, start=start, end=end,
+            content=content, source=source, wait_for_index=wait_for_index, file_hash=file_hash,
+            executor=blocking_executor,
+        )
+        # Each piece is only produced once the previous one was sent, so a slow
+        # client pauses its own agent stream. A disconnect cancels this task and
+        # aclose() tears down the upstream LLM request.
+        try:
+            async for piece in agen:
+                yield piece
+        finally:
+            await agen.aclose()
+            stream_slots.release()
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+async def download_file(request):
+    filename = request.path_params["filename"]
+    downloads_dir = os.path.join(os.getcwd(), "downloads")
+    file_path = os.path.realpath(os.path.join(downloads_dir, filename))
+
+    if not file_path.startswith(os.path.realpath(downloads_dir) + os.sep) or not os.path.exists(file_path):
+        return Response(status_code=404)
+
+    # Content-addressed versions never change, current documents are revalidated
+    etag = download_etag(os.path.basename(file_path))
+    stat = os.stat(file_path)
+    if etag:
+        headers = {"etag": f'"{etag}"', "cache-control": "public, max-age=31536000, immutable"}
+    else:
+        headers = {"etag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"', "cache-control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["etag"]:
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(file_path, filename=os.path.basename(file_path), headers=headers, stat_result=stat)
+
+async def apply_change(request):
+    user_id = request.query_params.get("user_id")
+    edit_info = await _run_blocking(get_pending_edits, user_id)
+    if edit_info and "new_content" in edit_info:
+        return JSONResponse({
+            "content": edit_info["new_content"],
+            "start": edit_info["start"],
+            "end": edit_info["end"]
+        })
+    else:
+        return JSONResponse({"content": ""}, status_code=404)
+
+async def save_uploaded_docx(request):
+    form = await request.form()
+    file = form.get("file")
+    user_id = form.get("user_id")
+    if not file or not user_id:
+        return JSONResponse({"error": "Missing file or user_id"}, status_code=400)
+
+    # The current document may be a link to a shared version, never write into it
+    data = await file.read()
+    filename = await _run_blocking(save_current_docx, user_id, data)
+    return JSONResponse({"status": "success", "filename": filename})
+
+async def ingest_status(request):
+    user_id = request.query_params.get("user_id")
+    job_id = request.query_params.get("job_id")
+    if not user_id:
+        return JSONResponse({"error": "Missing user_id"}, status_code=400)
+    jobs = get_ingest_status(user_id, job_id)
+    if job_id and not jobs:
+        return JSONResponse({"error": "Unknown job"}, status_code=404)
+    return JSONResponse({"jobs": jobs})
+
+async def conversation_stats(request):
+    user_id = request.query_params.get("user_id")
+    if not user_id:
+        return JSONResponse({"error": "Missing user_id"}, status_code=400)
+    return JSONResponse(await _run_blocking(get_conversation_stats, user_id))
+
+async def metrics(request):
+    return Response(await _run_blocking(get_metrics), media_type="text/plain; version=0.0.4")
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", chat, methods=["POST"]),
+        Route("/api/ingest_status", ingest_status),
+        Route("/api/conversation_stats", conversation_stats),
+        Route("/metrics", metrics),
+        Route("/downloads/{filename:path}", download_file),
+        Route("/apply_change", apply_change),
+        Route("/api/save", save_uploaded_docx, methods=["POST"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+)
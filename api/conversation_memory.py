@@ -0,0 +1,170 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import tiktoken
+from langchain_core.messages import HumanMessage, AIMessage
+
+MEMORY_PATH = os.environ.get("CONVERSATION_DB_PATH", os.path.join("data", "conversations.sqlite3"))
+HISTORY_TOKEN_BUDGET = int(os.environ.get("HISTORY_TOKEN_BUDGET", "4000"))
+MAX_LOADED_THREADS = int(os.environ.get("MAX_LOADED_THREADS", "512"))
+THREAD_IDLE_SECONDS = float(os.environ.get("THREAD_IDLE_SECONDS", "1800"))
+MAX_STORED_MESSAGES = int(os.environ.get("MAX_STORED_MESSAGES", "200"))
+
+_MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage}
+
+
+def _load_encoding(model: str):
+    # tiktoken downloads the BPE file on first use (cached under
+    # TIKTOKEN_CACHE_DIR). Without network access the budget falls back to an
+    # estimate instead of failing the import.
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Could not load the tiktoken encoding for {model}, estimating token counts: {e}")
+        return None
+
+
+class ConversationStore:
+    # Chat history persisted to SQLite, with only recently active threads held
+    # in RAM. history() hands the agent the newest messages that fit a token
+    # budget instead of the whole thread.
+    def __init__(self, path: str = MEMORY_PATH, model: str = "gpt-4o-mini"):
+        self.encoding = _load_encoding(model)
+        self._lock = threading.Lock()
+        self._threads = OrderedDict()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "thread_id TEXT, seq INTEGER, role TEXT, content TEXT, tokens INTEGER, created REAL, "
+            "PRIMARY KEY (thread_id, seq))"
+        )
+        self._db.commit()
+
+    def count_tokens(self, text: str) -> int:
+        if self.encoding is None:
+            # About four bytes per token for English text
+            return (len(text.encode("utf-8")) + 3) // 4
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        while self._threads:
+            thread_id, thread = next(iter(self._threads.items()))
+            if len(self._threads) <= MAX_LOADED_THREADS and now - thread["last_used"] < THREAD_IDLE_SECONDS:
+                break
+            del self._threads[thread_id]
+
+    def _rows(self, thread_id: str) -> list:
+        return self._db.execute(
+            "SELECT seq, role, content, tokens FROM messages WHERE thread_id = ? ORDER BY seq",
+            (thread_id,),
+        ).fetchall()
+
+    def _load(self, thread_id: str) -> dict:
+        # Other worker processes write to the same database, so a cached
+        # thread is only used while its last seq still matches the table
+        thread = self._threads.get(thread_id)
+        if thread is not None:
+            last_seq = self._db.execute(
+                "SELECT MAX(seq) FROM messages WHERE thread_id = ?", (thread_id,)
+            ).fetchone()[0]
+            cached_seq = thread["messages"][-1][0] if thread["messages"] else None
+            if last_seq != cached_seq:
+                thread["messages"] = self._rows(thread_id)
+        else:
+            thread = {"messages": self._rows(thread_id), "last_used": 0.0}
+            self._threads[thread_id] = thread
+        self._threads.move_to_end(thread_id)
+        thread["last_used"] = time.monotonic()
+        self._evict_idle()
+        return thread
+
+    def append(self, thread_id: str, role: str, content: str):
+        if not content:
+            return
+        tokens = self.count_tokens(content)
+        with self._lock:
+            # seq is taken from the table inside a write transaction, so two
+            # workers appending to one thread never pick the same number
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._db.execute(
+                    "INSERT INTO messages SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ?, ? "
+                    "FROM messages WHERE thread_id = ?",
+                    (thread_id, role, content, tokens, time.time(), thread_id),
+                )
+                seq = self._db.execute("SELECT seq FROM messages WHERE rowid = ?", (cursor.lastrowid,)).fetchone()[0]
+                self._db.execute(
+                    "DELETE FROM messages WHERE thread_id = ? AND seq <= ?",
+                    (thread_id, seq - MAX_STORED_MESSAGES),
+                )
+                self._db.commit()
+            except Exception:
+                self._db.rollback()
+                raise
+
+            thread = self._threads.get(thread_id)
+            if thread is not None:
+                cached_seq = thread["messages"][-1][0] if thread["messages"] else -1
+                if cached_seq == seq - 1:
+                    thread["messages"].append((seq, role, content, tokens))
+                    thread["messages"] = thread["messages"][-MAX_STORED_MESSAGES:]
+                else:
+                    # Another worker appended in between
+                    thread["messages"] = self._rows(thread_id)
+                thread["last_used"] = time.monotonic()
+
+    def history(self, thread_id: str, budget: int = HISTORY_TOKEN_BUDGET) -> list:
+        with self._lock:
+            rows = list(self._load(thread_id)["messages"])
+
+        # Newest messages first until the budget is spent
+        selected = []
+        used = 0
+        for _, role, content, tokens in reversed(rows):
+            if used + tokens > budget:
+                break
+            selected.append((role, content))
+            used += tokens
+        selected.reverse()
+        # Never start the window on an AI reply whose question was trimmed away
+        while selected and selected[0][0] != "human":
+            selected.pop(0)
+        return [_MESSAGE_TYPES[role](content=content) for role, content in selected]
+
+    def thread_stats(self, thread_id: str) -> dict:
+        with self._lock:
+            loaded = thread_id in self._threads
+            if loaded:
+                rows = self._threads[thread_id]["messages"]
+            else:
+                rows = self._db.execute(
+                    "SELECT seq, role, content, tokens FROM messages WHERE thread_id = ?", (thread_id,)
+                ).fetchall()
+        return {
+            "thread_id": thread_id,
+            "loaded": loaded,
+            "messages": len(rows),
+            "tokens": sum(row[3] for row in rows),
+            "bytes": sum(len(row[2].encode()) for row in rows),
+            "budget": HISTORY_TOKEN_BUDGET,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded_threads": len(self._threads),
+                "loaded_messages": sum(len(thread["messages"]) for thread in self._threads.values()),
+                "loaded_bytes": sum(
+                    len(row[2].encode()) for thread in self._threads.values() for row in thread["messages"]
+                ),
+            }
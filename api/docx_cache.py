@@ -0,0 +1,129 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+import xxhash
+from docx import Document as DocxDocument
+
+MAX_DOCUMENTS = int(os.environ.get("DOCX_CACHE_SIZE", "64"))
+
+
+class DocxCache:
+    # Parsed python-docx documents with a paragraph index, keyed by path.
+    # An entry stays valid while the file's (mtime, size) is unchanged; if only
+    # the stamp moved, a content hash decides whether a re-parse is needed.
+    def __init__(self, max_documents: int = MAX_DOCUMENTS):
+        self.max_documents = max_documents
+        self.hits = 0
+        self.parses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._path_locks = {}
+
+    def _path_lock(self, path: str):
+        with self._lock:
+            if path not in self._path_locks:
+                self._path_locks[path] = threading.Lock()
+            return self._path_locks[path]
+
+    @staticmethod
+    def _stamp(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _remember(self, path: str, entry: dict):
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_documents:
+                self._entries.popitem(last=False)
+
+    def _load(self, path: str) -> dict:
+        # Caller holds the path lock
+        stamp = self._stamp(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+        if entry is not None and entry["stamp"] == stamp:
+            self.hits += 1
+            return entry
+
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = xxhash.xxh3_128_hexdigest(data)
+        if entry is not None and entry["hash"] == digest:
+            entry["stamp"] = stamp
+            self.hits += 1
+            return entry
+
+        doc = DocxDocument(io.BytesIO(data))
+        paragraphs = doc.paragraphs
+        entry = {
+            "stamp": stamp,
+            "hash": digest,
+            "doc": doc,
+            "paragraphs": paragraphs,
+            "texts": [para.text for para in paragraphs],
+        }
+        self.parses += 1
+        self._remember(path, entry)
+        return entry
+
+    def paragraphs(self, path: str, start: int = 0, end: int = None) -> list[str]:
+        path = os.path.realpath(path)
+        with self._path_lock(path):
+            return self._load(path)["texts"][start:end]
+
+    def find_section(self, path: str, section: list[str]) -> int:
+        # Index of the first paragraph of `section`, or -1 if it is not in the document
+        texts = self.paragraphs(path)
+        wanted = [text.strip() for text in section]
+        if not wanted:
+            return -1
+        for i in range(len(texts) - len(wanted) + 1):
+            if texts[i].strip() == wanted[0] and [t.strip() for t in texts[i:i + len(wanted)]] == wanted:
+                return i
+        return -1
+
+    def apply_edits(self, path: str, changes: list[dict]) -> int:
+        # All paragraph changes in one pass and a single save
+        path = os.path.realpath(path)
+        with self._path_lock(path):
+            entry = self._load(path)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                changed = 0
+                for change in changes:
+                    para_idx = change["para_idx"]
+                    new_text = change["new_text"]
+                    if entry["texts"][para_idx] == new_text:
+                        continue
+                    entry["paragraphs"][para_idx].text = new_text
+                    entry["texts"][para_idx] = new_text
+                    changed += 1
+                if not changed:
+                    return 0
+
+                buffer = io.BytesIO()
+                entry["doc"].save(buffer)
+                data = buffer.getvalue()
+                # Replace rather than rewrite in place, the path may be a link shared with other files
+                with open(tmp_path, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                # The cached tree may hold edits that never reached the file
+                with self._lock:
+                    if self._entries.get(path) is entry:
+                        del self._entries[path]
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            entry["hash"] = xxhash.xxh3_128_hexdigest(data)
+            entry["stamp"] = self._stamp(path)
+            return changed
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"documents": len(self._entries), "hits": self.hits, "parses": self.parses}
@@ -0,0 +1,122 @@
+import os
+import re
+import time
+import uuid
+import shutil
+import threading
+import xxhash
+
+DOWNLOADS_FOLDER = "downloads"
+MAX_BYTES = int(os.environ.get("DOWNLOADS_MAX_MB", "1024")) * 1024 * 1024
+MAX_AGE_SECONDS = float(os.environ.get("DOWNLOADS_MAX_AGE_DAYS", "30")) * 86400
+EVICT_INTERVAL_SECONDS = 60
+
+_CONTENT_NAME = re.compile(r"^[0-9a-f]{32}\.[a-z]+$")
+
+
+class DownloadsStore:
+    # Content-addressed files in downloads/. Identical exports share one file,
+    # and {user_id}_current.docx is a hard link to the user's latest version,
+    # never a second copy. Old versions are evicted by age and total size.
+    def __init__(self, folder: str = DOWNLOADS_FOLDER, max_bytes: int = MAX_BYTES, max_age: float = MAX_AGE_SECONDS):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._last_evict = 0.0
+        os.makedirs(folder, exist_ok=True)
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return xxhash.xxh3_128_hexdigest(data)
+
+    def path(self, filename: str) -> str:
+        return os.path.join(self.folder, filename)
+
+    def current_filename(self, user_id: str) -> str:
+        return f"{user_id}_current.docx"
+
+    def get(self, digest: str, ext: str = ".docx"):
+        # Filename of an already stored version, refreshed so eviction keeps it
+        filename = digest + ext
+        try:
+            os.utime(self.path(filename))
+        except FileNotFoundError:
+            return None
+        return filename
+
+    def put(self, data: bytes, digest: str = None, ext: str = ".docx") -> str:
+        digest = digest or self.digest(data)
+        filename = self.get(digest, ext)
+        if filename is None:
+            filename = digest + ext
+            tmp_path = f"{self.path(filename)}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(filename))
+        self.maybe_evict()
+        return filename
+
+    def link_current(self, user_id: str, filename: str) -> str:
+        current = self.current_filename(user_id)
+        source = self.path(filename)
+        target = self.path(current)
+        try:
+            # Renaming a link onto the same inode is a no-op that would leave the temp file behind
+            if os.path.samefile(source, target):
+                return current
+        except FileNotFoundError:
+            pass
+
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            try:
+                os.link(source, tmp_path)
+            except OSError:
+                # Filesystems without hard links get a copy instead
+                shutil.copyfile(source, tmp_path)
+            os.replace(tmp_path, target)
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+        return current
+
+    def save_current(self, user_id: str, data: bytes) -> str:
+        return self.link_current(user_id, self.put(data))
+
+    def etag(self, filename: str):
+        # Content-addressed names are their own ETag; other files fall back to the default
+        if _CONTENT_NAME.match(filename):
+            return filename.split(".")[0]
+        return None
+
+    def maybe_evict(self):
+        now = time.monotonic()
+        if now - self._last_evict < EVICT_INTERVAL_SECONDS:
+            return
+        self._last_evict = now
+        self.evict()
+
+    def evict(self):
+        with self._lock:
+            files = []
+            for entry in os.scandir(self.folder):
+                # Users' current documents are never evicted
+                if not entry.is_file() or entry.name.endswith("_current.docx") or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            files.sort()
+
+            cutoff = time.time() - self.max_age
+            total = sum(size for _, size, _ in files)
+            for mtime, size, path in files:
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                # A current link to this version keeps its data alive
+                os.remove(path)
+                total -= size
+                self.evicted += 1
@@ -0,0 +1,119 @@
+import os
+import re
+import json
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import HumanMessage
+from api.metrics import span, llm_tokens
+
+BATCH_TOKENS = int(os.environ.get("EDIT_BATCH_TOKENS", "1200"))
+EDIT_WORKERS = int(os.environ.get("EDIT_WORKERS", "8"))
+EDIT_RETRIES = int(os.environ.get("EDIT_RETRIES", "2"))
+
+_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+def pack_batches(paragraphs: list[str], count_tokens, budget: int = BATCH_TOKENS) -> list[tuple[int, int]]:
+    # Consecutive (start, end) ranges of at most `budget` tokens. A paragraph
+    # over the budget on its own becomes a batch of one.
+    batches = []
+    start = 0
+    used = 0
+    for i, paragraph in enumerate(paragraphs):
+        tokens = count_tokens(paragraph) + 2
+        if i > start and used + tokens > budget:
+            batches.append((start, i))
+            start = i
+            used = 0
+        used += tokens
+    if start < len(paragraphs):
+        batches.append((start, len(paragraphs)))
+    return batches
+
+def _prompt(instruction: str, paragraphs: list[str]) -> str:
+    return (
+        "You are an AI assistant for document editing. "
+        "Edit each paragraph according to the user's instruction, but do not merge or split paragraphs. "
+        f"Return ONLY a JSON array of exactly {len(paragraphs)} strings, the revised paragraphs in the same order. "
+        "Do NOT include any explanations, markers or code fences."
+        "\n\n"
+        f"Instruction: {instruction}\nParagraph list: {json.dumps(paragraphs)}\n"
+    )
+
+def parse_batch(text: str, expected: int) -> list[str]:
+    text = _FENCE.sub("", text.strip().strip("-").strip())
+    revised = json.loads(text)
+    if not isinstance(revised, list) or not all(isinstance(item, str) for item in revised):
+        raise ValueError("Edited content is not a JSON array of strings")
+    if len(revised) != expected:
+        raise ValueError(f"Expected {expected} paragraphs, got {len(revised)}")
+    return revised
+
+
+class EditEngine:
+    # Map-style editing of a selection: paragraphs are packed into
+    # token-budgeted batches, each batch is one stateless model call, and all
+    # batches run concurrently. A batch that does not come back as a valid
+    # array of the right length is retried on its own, and if it keeps
+    # failing its paragraphs are left as they were.
+    def __init__(self, llm, count_tokens, batch_tokens: int = BATCH_TOKENS,
+                 workers: int = EDIT_WORKERS, retries: int = EDIT_RETRIES):
+        self.llm = llm
+        self.count_tokens = count_tokens
+        self.batch_tokens = batch_tokens
+        self.retries = retries
+        self.counts = {"batches": 0, "retries": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="edit")
+
+    def _edit_batch(self, instruction: str, paragraphs: list[str]):
+        prompt = _prompt(instruction, paragraphs)
+        self._count("batches")
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retries")
+            try:
+                with span("edit_batch"):
+                    response = self.llm.invoke([HumanMessage(content=prompt)])
+                llm_tokens.inc(self.count_tokens(prompt), direction="in")
+                llm_tokens.inc(self.count_tokens(response.content), direction="out")
+                return parse_batch(response.content, len(paragraphs)), True
+            except Exception as e:
+                print(f"Edit batch of {len(paragraphs)} paragraphs failed (attempt {attempt + 1}): {e}")
+        self._count("failed")
+        return paragraphs, False
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _submit(self, instruction: str, paragraphs: list[str]):
+        batches = pack_batches(paragraphs, self.count_tokens, self.batch_tokens)
+        return batches, [self._pool.submit(self._edit_batch, instruction, paragraphs[start:end]) for start, end in batches]
+
+    def stream(self, instruction: str, paragraphs: list[str]):
+        # Yields (start, revised paragraphs, ok) in document order, each batch
+        # as soon as it and every batch before it are done
+        batches, futures = self._submit(instruction, paragraphs)
+        try:
+            for (start, _), future in zip(batches, futures):
+                revised, ok = future.result()
+                yield start, revised, ok
+        finally:
+            for future in futures:
+                future.cancel()
+
+    async def astream(self, instruction: str, paragraphs: list[str]):
+        batches, futures = self._submit(instruction, paragraphs)
+        try:
+            for (start, _), future in zip(batches, futures):
+                revised, ok = await asyncio.wrap_future(future)
+                yield start, revised, ok
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counts)
@@ -0,0 +1,176 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+import xxhash
+from langchain_core.embeddings import Embeddings
+
+CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", os.path.join("data", "embedding_cache.sqlite3"))
+CACHE_MAX_MB = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "1024"))
+CACHE_DTYPE = os.environ.get("EMBEDDING_CACHE_DTYPE", "float16")
+MEMORY_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(self, underlying: Embeddings, model: str, path: str = CACHE_PATH,
+                 max_bytes: int = CACHE_MAX_MB * 1024 * 1024, dtype: str = CACHE_DTYPE,
+                 memory_entries: int = MEMORY_ENTRIES, batch_size: int = 512):
+        self.underlying = underlying
+        self.model = model
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.memory_entries = memory_entries
+        self.batch_size = batch_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.api_calls = 0
+        self.api_texts = 0
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, dtype TEXT, vector BLOB, size INTEGER, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._db.commit()
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    def _key(self, text: str) -> bytes:
+        return xxhash.xxh3_128_digest(self.model.encode() + b"\x00" + text.encode())
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        # Vectors stay NumPy arrays at the cache dtype, a 3072-dim float16
+        # vector is 6 KB where a list of Python floats is about 100 KB
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _lookup(self, keys: list[bytes]) -> dict:
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                found[key] = self._memory[key]
+            else:
+                missing.append(key)
+
+        now = time.time()
+        # SQLite limits the number of bound parameters, so look keys up in slices
+        for i in range(0, len(missing), 500):
+            part = missing[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall()
+            for key, dtype, blob in rows:
+                vector = np.frombuffer(blob, dtype=dtype)
+                found[key] = vector
+                self._remember(key, vector)
+            if rows:
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, row[0]) for row in rows])
+        return found
+
+    def _store(self, items: list[tuple[bytes, list[float]]]) -> list[np.ndarray]:
+        now = time.time()
+        rows = []
+        stored = []
+        for key, vector in items:
+            blob = np.asarray(vector, dtype=self.dtype).tobytes()
+            rows.append((key, self.dtype.name, blob, len(blob), now))
+            # Hand back the stored precision so hits and misses return identical vectors
+            vector = np.frombuffer(blob, dtype=self.dtype)
+            self._remember(key, vector)
+            stored.append(vector)
+        # Another worker may have stored the same text meanwhile, a replaced
+        # row only changes the total by the difference in size
+        replaced = 0
+        for i in range(0, len(rows), 500):
+            part = [row[0] for row in rows[i:i + 500]]
+            replaced += self._db.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchone()[0]
+        self._db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        self._total_bytes += sum(row[3] for row in rows) - replaced
+        self._evict()
+        return stored
+
+    def _evict(self):
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Other workers write to the same file, recount before dropping anything
+        self._total_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under 90% of the cap
+        target = self.max_bytes * 0.9
+        cursor = self._db.execute("SELECT key, size FROM embeddings ORDER BY last_used ASC")
+        evicted = []
+        for key, size in cursor:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+            self._memory.pop(key, None)
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(text) for text in texts]
+
+        with self._lock:
+            found = self._lookup(list(dict.fromkeys(keys)))
+            self._db.commit()
+
+        # Deduplicate within the batch so each unique text is embedded once
+        pending = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+
+        hits = sum(1 for key in keys if key in found)
+        if pending:
+            pending_keys = list(pending)
+            pending_texts = list(pending.values())
+            for i in range(0, len(pending_texts), self.batch_size):
+                vectors = self.underlying.embed_documents(pending_texts[i:i + self.batch_size])
+                batch = list(zip(pending_keys[i:i + self.batch_size], vectors))
+                with self._lock:
+                    self.api_calls += 1
+                    self.api_texts += len(batch)
+                    stored = self._store(batch)
+                    self._db.commit()
+                for (key, _), vector in zip(batch, stored):
+                    found[key] = vector
+
+        with self._lock:
+            self.hits += hits
+            self.misses += len(keys) - hits
+
+        return [found[key].astype(np.float32).tolist() for key in keys]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "model": self.model,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "api_calls": self.api_calls,
+                "api_texts": self.api_texts,
+                "memory_entries": len(self._memory),
+                "memory_bytes": sum(vector.nbytes for vector in self._memory.values()),
+                "disk_bytes": self._total_bytes,
+            }
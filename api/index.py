@@ -1,6 +1,7 @@
 from flask import Flask, request, Response, send_from_directory, abort, jsonify
 from flask_cors import CORS
-from api.server import invoke_stream, get_pending_edits
+from api.server import invoke_stream, get_pending_edits, get_ingest_status, get_conversation_stats, save_current_docx, download_etag, get_metrics
+from api.upload_store import save_upload
 import os
 import json
 
@@ -18,16 +19,40 @@ def chat():
     start = request.form.get("doc_start")
     end = request.form.get("doc_end")
     content_req = request.form.get("doc_content")
+    wait_for_index = request.form.get("wait_for_index", os.environ.get("INGEST_WAIT", "1")) not in ("0", "false")
     content = None
     if isinstance(content_req, str):
         content = json.loads(content_req)
     file_path = ""
+    file_hash = None
+    source = ""
     if file:
-        _, ext = os.path.splitext(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, "sample" + ext)
-        file.save(file_path)
+        source = file.filename
+        file_path, file_hash = save_upload(file.stream, user_id, file.filename)
 
-    return Response(invoke_stream(question=question, user_id=user_id, file_path=file_path, start=start, end=end, content=content), mimetype="text/event-stream")
+    return Response(invoke_stream(question=question, user_id=user_id, file_path=file_path, start=start, end=end, content=content, source=source, wait_for_index=wait_for_index, file_hash=file_hash), mimetype="text/event-stream")
+
+@app.route("/api/ingest_status")
+def ingest_status():
+    user_id = request.args.get("user_id")
+    job_id = request.args.get("job_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+    jobs = get_ingest_status(user_id, job_id)
+    if job_id and not jobs:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"jobs": jobs})
+
+@app.route("/api/conversation_stats")
+def conversation_stats():
+    user_id = request.args.get("user_id")
+    if not user_id:
+        return jsonify({"error": "Missing user_id"}), 400
+    return jsonify(get_conversation_stats(user_id))
+
+@app.route("/metrics")
+def metrics():
+    return Response(get_metrics(), mimetype="text/plain; version=0.0.4")
 
 @app.route("/downloads/<path:filename>")
 def download_file(filename):
@@ -37,7 +62,11 @@ def download_file(filename):
     if not os.path.exists(file_path):
         abort(404)
 
-    return send_from_directory(downloads_dir, filename, as_attachment=True)
+    # Content-addressed versions never change, current documents are revalidated
+    etag = download_etag(filename)
+    if etag:
+        return send_from_directory(downloads_dir, filename, as_attachment=True, etag=etag, max_age=31536000)
+    return send_from_directory(downloads_dir, filename, as_attachment=True, max_age=0)
 
 @app.route("/apply_change")
 def apply_change():
@@ -59,9 +88,6 @@ def save_uploaded_docx():
     if not file or not user_id:
         return jsonify({"error": "Missing file or user_id"}), 400
 
-    save_dir = "downloads"
-    os.makedirs(save_dir, exist_ok=True)
-    save_path = os.path.join(save_dir, f"{user_id}_current.docx")
-    file.save(save_path)
-    # Add this line:
-    return jsonify({"status": "success", "filename": f"{user_id}_current.docx"})
\ No newline at end of file
+    # The current document may be a link to a shared version, never write into it
+    filename = save_current_docx(user_id, file.read())
+    return jsonify({"status": "success", "filename": filename})
\ No newline at end of file
@@ -0,0 +1,109 @@
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pinecone import ServerlessSpec
+
+
+class IndexRegistry:
+    # Caches Pinecone index handles and the index list, and provisions missing
+    # indexes in the background instead of blocking the request.
+    #
+    # mode="dedicated": one index per user (md5 of the user id), the historical layout.
+    # mode="shared": one shared index, every user is a namespace inside it.
+    def __init__(self, pc, mode: str = "dedicated", shared_index: str = "chatbot-rag",
+                 dimension: int = 3072, metric: str = "cosine", ttl: float = 60.0,
+                 spec=None):
+        self.pc = pc
+        self.mode = mode
+        self.shared_index = shared_index
+        self.dimension = dimension
+        self.metric = metric
+        self.ttl = ttl
+        self.spec = spec or ServerlessSpec(cloud="aws", region="us-east-1")
+
+        self._lock = threading.Lock()
+        self._existing = set()
+        self._existing_at = 0.0
+        self._handles = {}
+        self._provisioning = {}
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="index-provision")
+
+    def index_name(self, user_id: str) -> str:
+        if self.mode == "shared":
+            return self.shared_index
+        return hashlib.md5(user_id.encode()).hexdigest()
+
+    def namespace(self, user_id: str):
+        if self.mode == "shared":
+            return hashlib.md5(user_id.encode()).hexdigest()
+        return None
+
+    def _refresh(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._existing_at < self.ttl:
+            return False
+        existing = {index_info["name"] for index_info in self.pc.list_indexes()}
+        with self._lock:
+            self._existing = existing
+            self._existing_at = now
+        return True
+
+    def _provision(self, index_name: str):
+        try:
+            self._refresh(force=True)
+            if index_name not in self._existing:
+                print(f"Provisioning index {index_name}")
+                self.pc.create_index(
+                    name=index_name,
+                    dimension=self.dimension,
+                    metric=self.metric,
+                    spec=self.spec,
+                )
+            while not self.pc.describe_index(index_name).status["ready"]:
+                time.sleep(1)
+            with self._lock:
+                self._existing.add(index_name)
+                self._handles[index_name] = self.pc.Index(index_name)
+        finally:
+            with self._lock:
+                self._provisioning.pop(index_name, None)
+
+    def _start_provisioning(self, index_name: str):
+        with self._lock:
+            future = self._provisioning.get(index_name)
+            if future is None:
+                future = self._executor.submit(self._provision, index_name)
+                self._provisioning[index_name] = future
+            return future
+
+    def get(self, user_id: str, timeout: float = 0):
+        # Returns the Index handle, or None while it is still being provisioned.
+        # A positive timeout waits that long for provisioning to finish.
+        index_name = self.index_name(user_id)
+        handle = self._handles.get(index_name)
+        if handle is not None:
+            return handle
+
+        if index_name not in self._provisioning:
+            fetched = self._refresh()
+            if index_name not in self._existing and not fetched:
+                # The cached list may be stale, double check before creating
+                self._refresh(force=True)
+            if index_name in self._existing:
+                with self._lock:
+                    handle = self._handles.setdefault(index_name, self.pc.Index(index_name))
+                return handle
+
+        future = self._start_provisioning(index_name)
+        if timeout:
+            future.result(timeout=timeout)
+            return self._handles.get(index_name)
+        return None
+
+    def invalidate(self, user_id: str):
+        index_name = self.index_name(user_id)
+        with self._lock:
+            self._handles.pop(index_name, None)
+            self._existing.discard(index_name)
+            self._existing_at = 0.0
@@ -0,0 +1,83 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+import uuid
+import xxhash
+from contextlib import contextmanager
+
+MANIFEST_FOLDER = os.path.join("data", "manifests")
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+@contextmanager
+def user_lock(user_id: str):
+    # Threads of this process queue on the in-memory lock, other worker
+    # processes on an flock of the user's lock file, so a manifest is never
+    # loaded, planned against and saved by two jobs at once
+    with _locks_guard:
+        if user_id not in _locks:
+            _locks[user_id] = threading.Lock()
+        lock = _locks[user_id]
+    os.makedirs(MANIFEST_FOLDER, exist_ok=True)
+    lock_path = os.path.join(MANIFEST_FOLDER, hashlib.md5(user_id.encode()).hexdigest() + ".lock")
+    with lock, open(lock_path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def _manifest_path(user_id: str, index_key: str) -> str:
+    # One manifest per user and vector index: what is in one index (or
+    # namespace) says nothing about another
+    return os.path.join(MANIFEST_FOLDER, hashlib.md5(f"{user_id}\x00{index_key}".encode()).hexdigest() + ".json")
+
+def load_manifest(user_id: str, index_key: str) -> dict:
+    path = _manifest_path(user_id, index_key)
+    if not os.path.exists(path):
+        return {"documents": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(user_id: str, index_key: str, manifest: dict):
+    os.makedirs(MANIFEST_FOLDER, exist_ok=True)
+    path = _manifest_path(user_id, index_key)
+    # Write to a temp file first so a crash never leaves a half-written manifest
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def chunk_id(source: str, text: str) -> str:
+    # Deterministic vector id: the same chunk of the same document always maps to the same id
+    return xxhash.xxh3_128_hexdigest(source.encode() + b"\x00" + text.encode())
+
+def plan_chunks(manifest: dict, source: str, chunks):
+    # Splits `chunks` into the ones the index does not have yet and the ids
+    # that are no longer part of `source`
+    previous = set(manifest["documents"].get(source, {}).get("chunks", []))
+
+    new_ids = []
+    new_chunks = []
+    current = []
+    seen = set()
+    for chunk in chunks:
+        cid = chunk_id(source, chunk.page_content)
+        if cid in seen:
+            continue
+        seen.add(cid)
+        current.append(cid)
+        if cid not in previous:
+            new_ids.append(cid)
+            new_chunks.append(chunk)
+
+    stale_ids = list(previous - seen)
+    return new_ids, new_chunks, stale_ids, current
@@ -0,0 +1,262 @@
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain_pinecone import PineconeVectorStore
+from api.ingest import user_lock, load_manifest, save_manifest, plan_chunks, chunk_id
+from api.metrics import span, stage_seconds, chunks_indexed, chunks_unchanged
+
+EMBED_BATCH_SIZE = 128
+EMBED_WORKERS = 2
+PINECONE_UPSERT_BATCH = 32
+QUEUE_SIZE = 4
+JOB_RETENTION_SECONDS = 3600
+
+_STOP = object()
+
+
+class IngestJob:
+    def __init__(self, user_id: str, source: str, index_key: str, file_hash: str = None):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.source = source
+        self.index_key = index_key
+        self.file_hash = file_hash
+        self.status = "queued"
+        self.error = None
+        self.chunks = 0
+        self.embedded = 0
+        self.upserted = 0
+        self.deleted = 0
+        self.unchanged = 0
+        self.timings = {}
+        self.created_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "error": self.error,
+            "chunks": self.chunks,
+            "embedded": self.embedded,
+            "upserted": self.upserted,
+            "deleted": self.deleted,
+            "unchanged": self.unchanged,
+            "timings": self.timings,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ingest")
+
+def _forget_old_jobs():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    for job_id in [job_id for job_id, job in _jobs.items() if job.finished_at and job.finished_at < cutoff]:
+        del _jobs[job_id]
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+def user_jobs(user_id: str) -> list[IngestJob]:
+    with _jobs_lock:
+        return [job for job in _jobs.values() if job.user_id == user_id]
+
+def _upsert(vector_store, texts, vectors, metadatas, ids):
+    if isinstance(vector_store, PineconeVectorStore):
+        # The records add_texts would write, without embedding the texts again
+        records = [
+            (vid, vector.tolist(), {**metadata, vector_store._text_key: text})
+            for vid, text, vector, metadata in zip(ids, texts, vectors, metadatas)
+        ]
+        for i in range(0, len(records), PINECONE_UPSERT_BATCH):
+            vector_store.index.upsert(vectors=records[i:i + PINECONE_UPSERT_BATCH], namespace=vector_store._namespace)
+    elif hasattr(vector_store, "add_embeddings"):
+        vector_store.add_embeddings(texts, np.stack(vectors), metadatas=metadatas, ids=ids)
+    else:
+        # Any other store embeds the texts itself
+        vector_store.add_texts(texts, metadatas=metadatas, ids=ids)
+
+def _extract_and_embed(job: IngestJob, loader, splitter, embeddings, indexed: set, vectors: dict) -> list:
+    # Extraction, splitting and embedding overlap: every batch of documents
+    # the loader yields is split right away, and chunks the index does not
+    # have yet go to the embed workers while extraction carries on. Upserts
+    # wait for the whole file, because the manifest plan and the section
+    # labels need every chunk, so the vectors are kept in `vectors` (chunk
+    # id -> float32 array) until then.
+    embed_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    errors = []
+
+    def embed_worker():
+        while True:
+            batch = embed_queue.get()
+            if batch is _STOP:
+                break
+            if errors:
+                continue
+            try:
+                ids, texts = batch
+                with span("embed"):
+                    embedded = embeddings.embed_documents(texts)
+                vectors.update((cid, np.asarray(vector, dtype=np.float32)) for cid, vector in zip(ids, embedded))
+                job.embedded += len(texts)
+            except Exception as e:
+                errors.append(e)
+
+    embedders = [threading.Thread(target=embed_worker, daemon=True) for _ in range(EMBED_WORKERS)]
+    for thread in embedders:
+        thread.start()
+
+    chunks = []
+    pending = []
+    pending_ids = []
+    seen = set(indexed)
+    extract_seconds = split_seconds = 0.0
+    try:
+        batches = iter(loader())
+        while not errors:
+            mark = time.perf_counter()
+            docs = next(batches, None)
+            extract_seconds += time.perf_counter() - mark
+            if docs is None:
+                break
+
+            mark = time.perf_counter()
+            batch_chunks = splitter(docs)
+            split_seconds += time.perf_counter() - mark
+            chunks.extend(batch_chunks)
+            job.chunks = len(chunks)
+
+            for chunk in batch_chunks:
+                cid = chunk_id(job.source, chunk.page_content)
+                if cid not in seen:
+                    seen.add(cid)
+                    pending_ids.append(cid)
+                    pending.append(chunk.page_content)
+            while len(pending) >= EMBED_BATCH_SIZE:
+                embed_queue.put((pending_ids[:EMBED_BATCH_SIZE], pending[:EMBED_BATCH_SIZE]))
+                pending_ids = pending_ids[EMBED_BATCH_SIZE:]
+                pending = pending[EMBED_BATCH_SIZE:]
+        if pending and not errors:
+            embed_queue.put((pending_ids, pending))
+    finally:
+        for _ in embedders:
+            embed_queue.put(_STOP)
+        for thread in embedders:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+    stage_seconds.observe(extract_seconds, stage="extract")
+    stage_seconds.observe(split_seconds, stage="split")
+    job.timings["extract"] = round(extract_seconds, 3)
+    job.timings["split"] = round(split_seconds, 3)
+    return chunks
+
+def _run_pipeline(job: IngestJob, loader, splitter, get_store, embeddings, label=None):
+    started = time.perf_counter()
+    indexed = load_manifest(job.user_id, job.index_key)["documents"].get(job.source, {})
+    if job.file_hash and indexed.get("file_hash") == job.file_hash:
+        # Same bytes as the version already in the index, nothing to do
+        job.chunks = job.unchanged = len(indexed.get("chunks", []))
+        job.timings["total"] = round(time.perf_counter() - started, 3)
+        return
+
+    job.status = "extracting"
+    vectors = {}
+    chunks = _extract_and_embed(job, loader, splitter, embeddings, set(indexed.get("chunks", [])), vectors)
+    job.timings["extract_embed"] = round(time.perf_counter() - started, 3)
+    if label is not None:
+        chunks = label(chunks)
+
+    mark = time.perf_counter()
+    job.status = "waiting_for_index"
+    with span("index_wait"):
+        vector_store = get_store()
+    if vector_store is None:
+        raise RuntimeError("Vector index is not available")
+    job.timings["index"] = round(time.perf_counter() - mark, 3)
+
+    with user_lock(job.user_id):
+        manifest = load_manifest(job.user_id, job.index_key)
+        new_ids, new_chunks, stale_ids, current = plan_chunks(manifest, job.source, chunks)
+        job.unchanged = len(current) - len(new_ids)
+
+        mark = time.perf_counter()
+        job.status = "indexing"
+        # Chunks were embedded against the manifest as it was when extraction
+        # started, anything another job removed since is embedded now
+        missing = [i for i, cid in enumerate(new_ids) if cid not in vectors]
+        if missing:
+            with span("embed"):
+                embedded = embeddings.embed_documents([new_chunks[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[new_ids[i]] = np.asarray(vector, dtype=np.float32)
+            job.embedded += len(missing)
+
+        for i in range(0, len(new_chunks), EMBED_BATCH_SIZE):
+            ids = new_ids[i:i + EMBED_BATCH_SIZE]
+            batch_chunks = new_chunks[i:i + EMBED_BATCH_SIZE]
+            with span("upsert"):
+                _upsert(
+                    vector_store,
+                    [chunk.page_content for chunk in batch_chunks],
+                    [vectors[cid] for cid in ids],
+                    [chunk.metadata for chunk in batch_chunks],
+                    ids,
+                )
+            job.upserted += len(ids)
+            chunks_indexed.inc(len(ids))
+
+        if stale_ids:
+            with span("delete_stale"):
+                vector_store.delete(ids=stale_ids)
+            job.deleted = len(stale_ids)
+
+        # The manifest only moves forward once every new chunk is in the index
+        manifest["documents"][job.source] = {"chunks": current, "file_hash": job.file_hash}
+        save_manifest(job.user_id, job.index_key, manifest)
+        chunks_unchanged.inc(job.unchanged)
+        job.timings["upsert"] = round(time.perf_counter() - mark, 3)
+
+    job.timings["total"] = round(time.perf_counter() - started, 3)
+
+def _run(job: IngestJob, loader, splitter, get_store, embeddings, label):
+    try:
+        _run_pipeline(job, loader, splitter, get_store, embeddings, label)
+        job.status = "done"
+        print(f"Indexing finished! {job.upserted} added, {job.unchanged} unchanged, {job.deleted} deleted {job.timings}")
+    except Exception as e:
+        job.status = "failed"
+        job.error = str(e)
+        print(f"Indexing {job.source} failed: {e}")
+    finally:
+        job.finished_at = time.time()
+        job._done.set()
+
+def start_ingest(user_id: str, source: str, index_key: str, loader, splitter, get_store, embeddings,
+                 file_hash: str = None, label=None) -> IngestJob:
+    # loader() yields lists of Documents, splitter turns one list into
+    # chunks and label, if given, sets metadata that needs all of them.
+    # index_key names the vector index the chunks go to, see load_manifest.
+    job = IngestJob(user_id, source, index_key, file_hash)
+    with _jobs_lock:
+        _forget_old_jobs()
+        _jobs[job.id] = job
+    _executor.submit(_run, job, loader, splitter, get_store, embeddings, label)
+    return job
@@ -0,0 +1,215 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.messages import HumanMessage
+
+INTENT_DEFINITIONS = {
+    "create_document": "User wants to start a new document from scratch.",
+    "upload_document": "User wants to edit current uploading document.",
+    "generate_outline": "User wants the AI to generate a draft/outline.",
+    "select_section": "User wants to select or retrieve a section of the document.",
+    "suggest_section": "AI suggests a section to the user for confirmation.",
+    "confirm_section": "User confirms the suggested section is correct and user wants to modify this section in the future.",
+    "edit_section": "User wants to edit the currently selected section.",
+    "continue_editing": "User wants to make further changes to the current section.",
+    "reject_change": "User wants to discard the last proposed change.",
+    "accept_change": "User wants to accept and apply the last proposed change.",
+    "download_document": "User wants to download the document.",
+    "export_document": "User wants to export the document in another format.",
+    "chat": "General conversation or unclear intent.",
+}
+VALID_INTENTS = set(INTENT_DEFINITIONS)
+
+INTENT_EXAMPLES = {
+    "create_document": [
+        "Write a new employment contract for a software engineer",
+        "Create a document about our company's remote work policy",
+        "Draft a cover letter for a marketing position",
+        "Can you write me a business proposal from scratch?",
+    ],
+    "upload_document": [
+        "I uploaded a file, help me edit it",
+        "Here is my document, let's work on it",
+        "Use the file I just attached",
+        "Edit the document I uploaded",
+    ],
+    "generate_outline": [
+        "Generate an outline for a research paper on climate change",
+        "Give me a rough draft structure for the report",
+        "What sections should this proposal have?",
+        "Make an outline for my thesis",
+    ],
+    "select_section": [
+        "Show me the introduction",
+        "Find the section about payment terms",
+        "Which paragraph talks about termination?",
+        "Select the conclusion of the document",
+    ],
+    "suggest_section": [
+        "Which section do you think I should change?",
+        "Suggest a part of the document to improve",
+        "What section needs the most work?",
+        "Point me to a section that needs editing",
+    ],
+    "confirm_section": [
+        "Yes, that's the section I meant",
+        "Correct, that is the right paragraph",
+        "That's the one, I want to work on it",
+        "Yes this section, let's modify it later",
+    ],
+    "edit_section": [
+        "Make this more concise",
+        "Rewrite this paragraph in a formal tone",
+        "Fix the grammar in the selected text",
+        "Translate this section into French",
+    ],
+    "continue_editing": [
+        "Make it even shorter",
+        "Now also change the tone to be friendlier",
+        "A bit more formal please",
+        "Keep going, tweak it a little more",
+    ],
+    "reject_change": [
+        "No, revert that",
+        "Discard the change",
+        "I don't like it, undo",
+        "Reject this edit",
+    ],
+    "accept_change": [
+        "Yes, apply it",
+        "Looks good, accept the change",
+        "Apply the edit to the document",
+        "Great, keep this version",
+    ],
+    "download_document": [
+        "Download the document",
+        "Give me a download link",
+        "Let me download the file",
+        "I want to save the docx",
+    ],
+    "export_document": [
+        "Export this as a PDF",
+        "Convert the document to markdown",
+        "Can I get this in HTML format?",
+        "Export to Word",
+    ],
+    "chat": [
+        "Hello, how are you?",
+        "What can you do?",
+        "Thanks!",
+        "What is the capital of France?",
+    ],
+}
+
+# High-precision phrases that need no model at all. They only match short
+# commands, so "apply a formal tone to this" or "write a section on export
+# controls" still reach the centroids.
+_OBJECT = r"(\s+(it|this|that|the\s+(document|doc|file|docx)))?"
+_FORMAT = r"(\s+(as|to|in|into)\s+(an?\s+)?(pdf|docx|word|markdown|md|html|txt|text)(\s+(file|format))?)?"
+KEYWORD_RULES = [
+    (re.compile(r"^(yes|ok|okay|sure|great|perfect|looks good)?[\s,.!]*(please\s+)?(accept|apply)(\s+(it|this|that|the\s+(change|edit)s?))?(\s+please)?[\s.!]*$"), "accept_change"),
+    (re.compile(r"^(no|nope)?[\s,.!]*(please\s+)?(reject|discard|revert|undo)(\s+(it|this|that|the\s+(change|edit)s?))?(\s+please)?[\s.!]*$"), "reject_change"),
+    (re.compile(r"^(please\s+)?export" + _OBJECT + _FORMAT + r"(\s+please)?[\s.!]*$"), "export_document"),
+    (re.compile(r"^(please\s+)?download" + _OBJECT + _FORMAT + r"(\s+please)?[\s.!]*$"), "download_document"),
+]
+
+MIN_SIMILARITY = float(os.environ.get("INTENT_MIN_SIMILARITY", "0.45"))
+MIN_MARGIN = float(os.environ.get("INTENT_MIN_MARGIN", "0.05"))
+CACHE_SIZE = 1024
+
+
+def _normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+def _instruction(prompt: str) -> str:
+    definitions = "".join(f"- {intent}: {definition}\n" for intent, definition in INTENT_DEFINITIONS.items())
+    return (
+        "You are an intent classifier for an AI-powered document editing assistant. "
+        "Given the user's chat message and the current workflow, classify the user's intent as one of the following: "
+        f"[{', '.join(INTENT_DEFINITIONS)}].\n"
+        "Definitions:\n"
+        f"{definitions}"
+        "Always respond with ONLY the intent word from the list above. "
+        f"User message: \"{prompt}\""
+    )
+
+
+class IntentClassifier:
+    # Keyword rules first, then nearest centroid over embedded examples, and a
+    # single stateless LLM call only when the centroid match is not confident.
+    def __init__(self, embeddings, llm):
+        self.embeddings = embeddings
+        self.llm = llm
+        self.counts = {"cache": 0, "rule": 0, "centroid": 0, "llm": 0}
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._labels = None
+        self._centroids = None
+
+    def _load_centroids(self):
+        if self._centroids is not None:
+            return
+        labels = list(INTENT_EXAMPLES)
+        texts = [text for intent in labels for text in INTENT_EXAMPLES[intent]]
+        vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        centroids = []
+        offset = 0
+        for intent in labels:
+            count = len(INTENT_EXAMPLES[intent])
+            centroid = vectors[offset:offset + count].mean(axis=0)
+            centroids.append(centroid / np.linalg.norm(centroid))
+            offset += count
+        self._labels = labels
+        self._centroids = np.stack(centroids)
+
+    def _by_rules(self, text: str):
+        for pattern, intent in KEYWORD_RULES:
+            if pattern.search(text):
+                return intent
+        return None
+
+    def _by_centroid(self, prompt: str):
+        self._load_centroids()
+        query = np.asarray(self.embeddings.embed_query(prompt), dtype=np.float32)
+        query /= np.linalg.norm(query)
+        scores = self._centroids @ query
+        best, second = np.argsort(scores)[::-1][:2]
+        if scores[best] >= MIN_SIMILARITY and scores[best] - scores[second] >= MIN_MARGIN:
+            return self._labels[best]
+        return None
+
+    def _by_llm(self, prompt: str) -> str:
+        response = self.llm.invoke([HumanMessage(content=_instruction(prompt))])
+        # Clean up and return only the intent word (lowercase, no punctuation)
+        intent = response.content.strip().lower().replace(".", "")
+        return intent if intent in VALID_INTENTS else "chat"
+
+    def classify(self, prompt: str) -> str:
+        key = _normalize_prompt(prompt or "")
+        if not key:
+            return "chat"
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.counts["cache"] += 1
+                return self._cache[key]
+
+        source = "rule"
+        intent = self._by_rules(key)
+        if intent is None:
+            source = "centroid"
+            intent = self._by_centroid(prompt)
+        if intent is None:
+            source = "llm"
+            intent = self._by_llm(prompt)
+
+        with self._lock:
+            self.counts[source] += 1
+            self._cache[key] = intent
+            while len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return intent
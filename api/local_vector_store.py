@@ -0,0 +1,301 @@
+import os
+import json
+import math
+import uuid
+import hashlib
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+LOCAL_VECTOR_FOLDER = os.environ.get("LOCAL_VECTOR_FOLDER", os.path.join("data", "vectors"))
+# Size-tiered compaction: segments within a factor of TIER_FACTOR of each
+# other share a tier, and once a tier holds MERGE_WIDTH segments they are
+# merged into one segment of the next tier. Every row is rewritten about
+# log(rows) / log(TIER_FACTOR) times, not on every compaction.
+TIER_FACTOR = int(os.environ.get("LOCAL_VECTOR_TIER_FACTOR", "4"))
+MERGE_WIDTH = int(os.environ.get("LOCAL_VECTOR_MERGE_WIDTH", "4"))
+MAX_DEAD_RATIO = 0.3
+
+
+class _Segment:
+    def __init__(self, number: int, vectors, rows: list[dict]):
+        self.number = number
+        self.vectors = vectors
+        self.ids = [row["id"] for row in rows]
+        self.texts = [row["text"] for row in rows]
+        self.metadatas = [row["metadata"] for row in rows]
+        self.alive = np.ones(len(rows), dtype=bool)
+        self._columns = {}
+        self._id_set = None
+
+    def tier(self) -> int:
+        return int(math.log(max(len(self.ids), 1), TIER_FACTOR))
+
+    def dead_ratio(self) -> float:
+        return 1 - self.alive.sum() / len(self.ids) if self.ids else 0.0
+
+    def has_id(self, vid: str) -> bool:
+        if self._id_set is None:
+            self._id_set = set(self.ids)
+        return vid in self._id_set
+
+    def column(self, key: str):
+        # Metadata values as an object array, so filters compare vectorized
+        if key not in self._columns:
+            self._columns[key] = np.array([m.get(key) for m in self.metadatas], dtype=object)
+        return self._columns[key]
+
+
+# Per-user vector index kept in append-only, memory-mapped NumPy segments.
+# Vectors are stored L2-normalized so cosine similarity is a single matmul.
+# Queries are an exact scan and memory-bandwidth bound, about 1 ms per 1,000
+# chunks of 3072-dim vectors on one core: single-digit milliseconds up to
+# ~5,000 chunks per user, ~100 ms at 100,000 (measured with
+# python -m benchmarks.bench_local_vectors). Larger corpora need Pinecone.
+class LocalVectorStore(VectorStore):
+    def __init__(self, embedding, folder: str):
+        self.embedding = embedding
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._segments = []
+        self._positions = {}
+        self._tombstones = {}
+        self.counts = {"segments_written": 0, "rows_written": 0, "compactions": 0}
+        os.makedirs(folder, exist_ok=True)
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding
+
+    def _segment_paths(self, number: int):
+        base = os.path.join(self.folder, f"seg_{number:06d}")
+        return base + ".npy", base + ".json"
+
+    def _tombstone_path(self) -> str:
+        return os.path.join(self.folder, "tombstones.json")
+
+    def _load(self):
+        numbers = sorted(
+            int(name[4:10]) for name in os.listdir(self.folder)
+            if name.startswith("seg_") and name.endswith(".json")
+        )
+        if os.path.exists(self._tombstone_path()):
+            with open(self._tombstone_path(), "r", encoding="utf-8") as f:
+                self._tombstones = json.load(f)
+        for number in numbers:
+            vector_path, rows_path = self._segment_paths(number)
+            with open(rows_path, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+            self._attach(_Segment(number, np.load(vector_path, mmap_mode="r"), rows))
+
+    def _attach(self, segment: _Segment):
+        # Later segments win for a repeated id; a tombstone only kills rows written before it
+        for row, vid in enumerate(segment.ids):
+            if self._tombstones.get(vid, -1) > segment.number:
+                segment.alive[row] = False
+                continue
+            previous = self._positions.get(vid)
+            if previous is not None:
+                previous[0].alive[previous[1]] = False
+            self._positions[vid] = (segment, row)
+        self._segments.append(segment)
+
+    def _next_number(self) -> int:
+        return self._segments[-1].number + 1 if self._segments else 1
+
+    def _write_segment(self, number: int, vectors, rows: list[dict]) -> _Segment:
+        vector_path, rows_path = self._segment_paths(number)
+        # Rows file is written last: a segment without it is ignored on load
+        np.save(vector_path, vectors)
+        with open(rows_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(rows, f)
+        os.replace(rows_path + ".tmp", rows_path)
+        self.counts["segments_written"] += 1
+        self.counts["rows_written"] += len(rows)
+        return _Segment(number, np.load(vector_path, mmap_mode="r"), rows)
+
+    def _save_tombstones(self):
+        with open(self._tombstone_path() + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self._tombstones, f)
+        os.replace(self._tombstone_path() + ".tmp", self._tombstone_path())
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def add_embeddings(self, texts, embeddings, metadatas=None, ids=None) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        rows = [
+            {"id": vid, "text": text, "metadata": metadata}
+            for vid, text, metadata in zip(ids, texts, metadatas)
+        ]
+        vectors = self._normalize(embeddings)
+
+        with self._lock:
+            segment = self._write_segment(self._next_number(), vectors, rows)
+            self._attach(segment)
+            self._maybe_compact()
+        return ids
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs) -> list[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def delete(self, ids=None, **kwargs):
+        if not ids:
+            return False
+        with self._lock:
+            number = self._next_number()
+            for vid in ids:
+                position = self._positions.pop(vid, None)
+                if position is not None:
+                    position[0].alive[position[1]] = False
+                self._tombstones[vid] = number
+            self._save_tombstones()
+            self._maybe_compact()
+        return True
+
+    def get_by_ids(self, ids) -> list[Document]:
+        docs = []
+        for vid in ids:
+            position = self._positions.get(vid)
+            if position is not None:
+                segment, row = position
+                docs.append(Document(id=vid, page_content=segment.texts[row], metadata=segment.metadatas[row]))
+        return docs
+
+    def _compaction_groups(self) -> list:
+        tiers = {}
+        for segment in self._segments:
+            tiers.setdefault(segment.tier(), []).append(segment)
+        groups = [group for group in tiers.values() if len(group) >= MERGE_WIDTH]
+        merging = {segment.number for group in groups for segment in group}
+        # A segment with many deleted or replaced rows is rewritten on its own
+        groups.extend(
+            [segment] for segment in self._segments
+            if segment.number not in merging and segment.dead_ratio() > MAX_DEAD_RATIO
+        )
+        return groups
+
+    def _maybe_compact(self):
+        # A merge can fill the next tier up, so repeat until nothing is left
+        groups = self._compaction_groups()
+        while groups:
+            self._compact(groups)
+            groups = self._compaction_groups()
+
+    def _compact(self, groups: list):
+        # Each group becomes one new segment holding its live rows. New
+        # segments get the highest numbers, which is safe because only the
+        # live copy of an id is carried over.
+        replaced = {segment.number for group in groups for segment in group}
+        kept = [segment for segment in self._segments if segment.number not in replaced]
+        number = self._next_number()
+        written = []
+        for group in groups:
+            rows = []
+            parts = []
+            for segment in group:
+                live = np.flatnonzero(segment.alive)
+                if not len(live):
+                    continue
+                parts.append(np.asarray(segment.vectors[live]))
+                rows.extend(
+                    {"id": segment.ids[i], "text": segment.texts[i], "metadata": segment.metadatas[i]}
+                    for i in live
+                )
+            if rows:
+                written.append(self._write_segment(number, np.concatenate(parts), rows))
+                number += 1
+
+        self._segments = kept
+        for segment in written:
+            self._attach(segment)
+        for number in sorted(replaced):
+            # Rows file first, a segment without it is ignored on load
+            for path in reversed(self._segment_paths(number)):
+                os.remove(path)
+        # A tombstone is only needed while an older segment still holds the
+        # id. They are pruned after the old files are gone, so a crash in
+        # between cannot bring deleted rows back.
+        self._tombstones = {
+            vid: tombstone for vid, tombstone in self._tombstones.items()
+            if any(segment.number < tombstone and segment.has_id(vid) for segment in kept)
+        }
+        self._save_tombstones()
+        self.counts["compactions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "rows": len(self._positions),
+                "dead_rows": sum(len(segment.ids) for segment in self._segments) - len(self._positions),
+                **self.counts,
+            }
+
+    def similarity_search_by_vector_with_score(self, embedding, k: int = 4, filter: dict = None):
+        query = self._normalize(embedding)
+        segments = list(self._segments)
+        candidates = []
+        for segment in segments:
+            if not len(segment.ids):
+                continue
+            mask = segment.alive.copy()
+            for key, value in (filter or {}).items():
+                mask &= segment.column(key) == value
+            if not mask.any():
+                continue
+            scores = segment.vectors @ query
+            scores = np.where(mask, scores, -np.inf)
+            top = min(k, int(mask.sum()))
+            best = np.argpartition(-scores, top - 1)[:top]
+            candidates.extend((float(scores[i]), segment, int(i)) for i in best)
+
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [
+            (Document(id=segment.ids[i], page_content=segment.texts[i], metadata=segment.metadatas[i]), score)
+            for score, segment, i in candidates[:k]
+        ]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict = None, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: dict = None, **kwargs):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict = None, **kwargs) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self):
+        # Scores are already cosine similarities
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, folder: str = None, **kwargs):
+        store = cls(embedding, folder or os.path.join(LOCAL_VECTOR_FOLDER, uuid.uuid4().hex))
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def local_store_folder(user_id: str) -> str:
+    return os.path.join(LOCAL_VECTOR_FOLDER, hashlib.md5(user_id.encode()).hexdigest())
+
+def get_local_store(user_id: str, embedding) -> LocalVectorStore:
+    folder = local_store_folder(user_id)
+    with _stores_lock:
+        if folder not in _stores:
+            _stores[folder] = LocalVectorStore(embedding, folder)
+        return _stores[folder]
@@ -0,0 +1,152 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Prometheus text-format metrics, kept per process. With several workers
+# every process serves its own /metrics.
+
+TIMING_LOG = os.environ.get("TIMING_LOG", "0") not in ("0", "false", "")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    labels = _labels(self.labels + ("le",), key + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram("chatbot_stage_seconds", "Time spent in each stage of a chat turn or ingestion.", ("stage",))
+first_token_seconds = Histogram("chatbot_time_to_first_token_seconds", "Time from the start of a chat turn to its first streamed frame.", ("intent",))
+turn_seconds = Histogram("chatbot_turn_seconds", "Total time of a chat turn.", ("intent",))
+llm_tokens = Counter("chatbot_llm_tokens_total", "Chat model tokens, counted with tiktoken.", ("direction",))
+chunks_indexed = Counter("chatbot_chunks_indexed_total", "Chunks upserted into a vector store.")
+chunks_unchanged = Counter("chatbot_chunks_unchanged_total", "Chunks skipped on ingestion because they were already indexed.")
+
+_metrics = [stage_seconds, first_token_seconds, turn_seconds, llm_tokens, chunks_indexed, chunks_unchanged]
+_collectors = []
+_current = contextvars.ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    # Per-request stage totals for the optional timing log line
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def summary(self) -> str:
+        parts = [f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.stages.items()]
+        parts.append(f"total={(time.perf_counter() - self.started) * 1000:.1f}ms")
+        return " ".join(parts)
+
+
+@contextmanager
+def track(timings: RequestTimings):
+    # Spans inside this block also count toward `timings`
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+@contextmanager
+def span(stage: str, timings: RequestTimings = None):
+    timings = timings or _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_seconds.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+def register_collector(prefix: str, stats):
+    # stats() -> dict, every numeric value becomes a gauge named <prefix>_<key>
+    _collectors.append((prefix, stats))
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for prefix, stats in _collectors:
+        try:
+            values = stats()
+        except Exception as e:
+            print(f"Metrics collector {prefix} failed: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"chatbot_{prefix}_{key}"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(value)}")
+    return "\n".join(lines) + "\n"
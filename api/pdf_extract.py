@@ -0,0 +1,166 @@
+import os
+import io
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pymupdf
+import pytesseract
+import xxhash
+from PIL import Image
+from langchain_core.documents import Document
+
+OCR_CACHE_FOLDER = os.path.join("data", "ocr_cache")
+EXTRACT_WORKERS = int(os.environ.get("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PAGES_PER_TASK = 8
+IMAGES_PER_TASK = 4
+# Images below these sizes are logos, bullets, separators and the like
+MIN_IMAGE_SIDE = int(os.environ.get("OCR_MIN_IMAGE_SIDE", "32"))
+MIN_IMAGE_AREA = int(os.environ.get("OCR_MIN_IMAGE_AREA", "4096"))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Forking a process that runs request threads can copy a held
+            # lock into the child, so workers start from a clean interpreter
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+def _reset_pool(pool):
+    # A worker that died (OOM, segfault in a parser) breaks the whole pool,
+    # the next extraction gets a new one
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _extract_pages(file_path: str, start: int, stop: int):
+    pages = []
+    doc = pymupdf.open(file_path)
+    for page_num in range(start, stop):
+        page = doc.load_page(page_num)
+        # (xref, smask, width, height, ...) - sizes are known without decoding
+        images = [(img[0], img[2], img[3]) for img in page.get_images(full=True)]
+        pages.append((page_num, page.get_text(), images))
+    doc.close()
+    return pages
+
+def _cached_ocr(image: Image.Image):
+    pixel_hash = xxhash.xxh3_128_hexdigest(
+        f"{image.mode}:{image.width}x{image.height}:".encode() + image.tobytes()
+    )
+    cache_path = os.path.join(OCR_CACHE_FOLDER, pixel_hash + ".txt")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return pixel_hash, f.read(), True
+
+    text = pytesseract.image_to_string(image)
+    os.makedirs(OCR_CACHE_FOLDER, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, cache_path)
+    return pixel_hash, text, False
+
+def _ocr_images(file_path: str, xrefs: list[int]):
+    results = []
+    doc = pymupdf.open(file_path)
+    for xref in xrefs:
+        base_image = doc.extract_image(xref)
+        image = Image.open(io.BytesIO(base_image["image"]))
+        pixel_hash, text, cached = _cached_ocr(image)
+        results.append((xref, pixel_hash, text, cached))
+    doc.close()
+    return results
+
+def _is_decorative(width: int, height: int) -> bool:
+    return min(width, height) < MIN_IMAGE_SIDE or width * height < MIN_IMAGE_AREA
+
+def _imap(fn, tasks, workers: int):
+    # Results in task order, each as soon as it and the ones before it are done
+    if workers <= 1:
+        for task in tasks:
+            yield fn(*task)
+        return
+    pool = _get_pool()
+    futures = [pool.submit(fn, *task) for task in tasks]
+    try:
+        for future in futures:
+            yield future.result()
+    except BrokenProcessPool:
+        _reset_pool(pool)
+        raise
+    finally:
+        for future in futures:
+            future.cancel()
+
+def iter_pdf(file_path: str, workers: int = EXTRACT_WORKERS, stats: dict = None):
+    # Yields lists of Documents as extraction goes: page text batch by batch,
+    # then the OCR text of figures, so the caller can split and embed early
+    stats = {} if stats is None else stats
+    stats.update(pages=0, images=0, images_unique=0, images_skipped=0, ocr_runs=0, ocr_cache_hits=0)
+    started = time.perf_counter()
+
+    doc = pymupdf.open(file_path)
+    page_count = len(doc)
+    doc.close()
+
+    page_tasks = [
+        (file_path, start, min(start + PAGES_PER_TASK, page_count))
+        for start in range(0, page_count, PAGES_PER_TASK)
+    ]
+    # Every xref is OCR'd once, on the first page it appears on
+    first_page = {}
+    for batch in _imap(_extract_pages, page_tasks, workers):
+        for page_num, _, images in batch:
+            for xref, width, height in images:
+                stats["images"] += 1
+                if xref in first_page:
+                    continue
+                if _is_decorative(width, height):
+                    stats["images_skipped"] += 1
+                    first_page[xref] = None
+                    continue
+                first_page[xref] = page_num
+        stats["pages"] += len(batch)
+        yield [Document(page_content=text, metadata={"page": page_num}) for page_num, text, _ in batch]
+    stats["text_seconds"] = round(time.perf_counter() - started, 3)
+
+    xrefs = [xref for xref, page_num in first_page.items() if page_num is not None]
+    image_tasks = [
+        (file_path, xrefs[i:i + IMAGES_PER_TASK])
+        for i in range(0, len(xrefs), IMAGES_PER_TASK)
+    ]
+    ocr_started = time.perf_counter()
+    seen_pixels = set()
+    for batch in _imap(_ocr_images, image_tasks, workers):
+        docs = []
+        for xref, pixel_hash, text, cached in batch:
+            stats["ocr_cache_hits" if cached else "ocr_runs"] += 1
+            # Different xrefs can still carry identical pixels
+            if pixel_hash in seen_pixels:
+                continue
+            seen_pixels.add(pixel_hash)
+            docs.append(Document(page_content=text, metadata={"page": first_page[xref]}))
+        if docs:
+            yield docs
+    stats["images_unique"] = len(seen_pixels)
+    stats["ocr_seconds"] = round(time.perf_counter() - ocr_started, 3)
+    stats["total_seconds"] = round(time.perf_counter() - started, 3)
+
+def extract_pdf(file_path: str, workers: int = EXTRACT_WORKERS):
+    stats = {}
+    docs = [doc for batch in iter_pdf(file_path, workers, stats) for doc in batch]
+    return docs, stats
+
+def extract_image(file_path: str):
+    image = Image.open(file_path)
+    _, text, _ = _cached_ocr(image)
+    return [Document(page_content=text)]
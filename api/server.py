@@ -1,56 +1,99 @@
 import os
 import io
-import json
 import time
+import asyncio
 from datetime import datetime
-import hashlib
-import pytesseract
-from PIL import Image
-import pymupdf
 import markdown2
 from bs4 import BeautifulSoup
 from docx import Document as DocxDocument
+from docx.shared import Pt
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import HumanMessage
 from langchain_openai import OpenAIEmbeddings
-from pinecone import Pinecone, ServerlessSpec
+from pinecone import Pinecone
 from langchain_pinecone import PineconeVectorStore
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.prebuilt import create_react_agent
 from langchain.tools.retriever import create_retriever_tool
-
-memory = MemorySaver()
+from api.ingest_pipeline import start_ingest, get_job, user_jobs
+from api.embedding_cache import CachedEmbeddings
+from api.local_vector_store import get_local_store, local_store_folder
+from api.index_registry import IndexRegistry
+from api.pdf_extract import iter_pdf, extract_image
+from api.intent import IntentClassifier
+from api.agent_cache import AgentCache
+from api.conversation_memory import ConversationStore
+from api.stream_output import MarkerParser, FrameCoalescer
+from api.docx_cache import DocxCache
+from api.downloads_store import DownloadsStore
+from api.session_store import make_session_store
+from api.upload_store import load_parsed, store_parsed
+from api.edit_engine import EditEngine
+from api import metrics
+from api.metrics import span, track, RequestTimings
+
+conversation_store = ConversationStore()
 llm = init_chat_model("gpt-4o-mini", model_provider="openai")
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+embedding_model = "text-embedding-3-large"
+embeddings = CachedEmbeddings(OpenAIEmbeddings(model=embedding_model), model=embedding_model)
 
 # Pinecone implementation
 pinecone_api_key = os.environ.get("PINECONE_API_KEY")
 
 pc = Pinecone(api_key=pinecone_api_key)
 
-def get_user_index(user_id: str):
-    index_name = hashlib.md5(user_id.encode()).hexdigest()
-    existing_indexes = [index_info["name"] for index_info in pc.list_indexes()]
+# "pinecone" or "local" (memory-mapped index under data/vectors)
+vector_backend = os.environ.get("VECTOR_BACKEND", "pinecone")
 
-    if index_name not in existing_indexes:
-        pc.create_index(
-            name=index_name,
-            dimension=3072,
-            metric="cosine",
-            spec=ServerlessSpec(cloud="aws", region="us-east-1"),
-        )
-        while not pc.describe_index(index_name).status["ready"]:
-            time.sleep(1)
+docx_cache = DocxCache()
+downloads_store = DownloadsStore()
+
+index_registry = IndexRegistry(
+    pc,
+    mode=os.environ.get("PINECONE_INDEX_MODE", "dedicated"),
+    shared_index=os.environ.get("PINECONE_SHARED_INDEX", "chatbot-rag"),
+    ttl=float(os.environ.get("PINECONE_INDEX_TTL", "60")),
+)
+
+provision_timeout = float(os.environ.get("PINECONE_PROVISION_TIMEOUT", "120"))
+
+def get_user_index(user_id: str, timeout: float = 0):
+    with span("get_user_index"):
+        return index_registry.get(user_id, timeout=timeout)
 
-    return pc.Index(index_name)
+def get_vector_store(user_id: str, timeout: float = 0):
+    # None while the user's Pinecone index is still being provisioned
+    if vector_backend == "local":
+        return get_local_store(user_id, embeddings)
+    index = get_user_index(user_id, timeout=timeout)
+    if index is None:
+        return None
+    return PineconeVectorStore(index=index, embedding=embeddings, namespace=index_registry.namespace(user_id))
+
+def vector_index_key(user_id: str) -> str:
+    # Which index (and namespace) the user's chunks live in, known before
+    # the index itself is ready
+    if vector_backend == "local":
+        return f"local/{os.path.abspath(local_store_folder(user_id))}"
+    return f"pinecone/{index_registry.index_name(user_id)}/{index_registry.namespace(user_id) or ''}"
+
+# Bump when the markdown -> DOCX rendering changes, so old exports are not reused
+DOCX_RENDER_VERSION = "1"
 
 def save_docx_file(content: str, user_id: str) -> str:
-    filename = f"{user_id}_{int(time.time())}.docx"
-    doc_path = os.path.join("downloads", filename)
-    os.makedirs("downloads", exist_ok=True)
+    # python-docx stamps zip entries with the save time, so identical exports
+    # are recognised by the markdown they were rendered from
+    digest = downloads_store.digest(f"{DOCX_RENDER_VERSION}\x00{content}".encode())
+    filename = downloads_store.get(digest)
+    if filename is None:
+        filename = downloads_store.put(render_docx(content), digest=digest)
+    downloads_store.link_current(user_id, filename)
+
+    # Replace with your actual base URL
+    return f"{os.environ.get('NEXT_PUBLIC_BACKEND_URL', 'http://localhost:5000')}/downloads/{filename}"
 
+def render_docx(content: str) -> bytes:
     # Convert markdown to HTML
     html = markdown2.markdown(content)
     soup = BeautifulSoup(html, "html.parser")
@@ -79,185 +122,162 @@ def save_docx_file(content: str, user_id: str) -> str:
                 elif child.name == "em":  # Italic
                     para.add_run(child.text).italic = True
                 elif child.name == "code":  # Code
-                    para.add_run(child.text).font.name = 'Courier New'
-                    para.add_run(child.text).font.size = Pt(10)
+                    run = para.add_run(child.text)
+                    run.font.name = 'Courier New'
+                    run.font.size = Pt(10)
 
         else:
             # For any other HTML element, just add the text
             doc.add_paragraph(element.text)
 
-    doc.save(doc_path)
-    current_doc_path = os.path.join("downloads", f"{user_id}_current.docx")
-    doc.save(current_doc_path)
-
-    # Replace with your actual base URL
-    return f"{os.environ.get('NEXT_PUBLIC_BACKEND_URL', 'http://localhost:5000')}/downloads/{filename}"
-
-def edit_docx(docx_path, changes):
-    doc = DocxDocument(docx_path)
-
-    for change in changes:
-        para_idx = change["para_idx"]
-        new_text = change["new_text"]
-        para = doc.paragraphs[para_idx]
-        para.text = new_text
-
-    doc.save(docx_path)
-
-def classify_intent(agent, prompt: str) -> str:
-    instruction = (
-        "You are an intent classifier for an AI-powered document editing assistant. "
-        "Given the user's chat message and the current workflow, classify the user's intent as one of the following: "
-        "[create_document, upload_document, generate_outline, select_section, suggest_section, confirm_section, "
-        "edit_section, continue_editing, reject_change, accept_change, download_document, export_document, chat].\n"
-        "Definitions:\n"
-        "- create_document: User wants to start a new document from scratch.\n"
-        "- upload_document: User wants to edit current uploading document.\n"
-        "- generate_outline: User wants the AI to generate a draft/outline.\n"
-        "- select_section: User wants to select or retrieve a section of the document.\n"
-        "- suggest_section: AI suggests a section to the user for confirmation.\n"
-        "- confirm_section: User confirms the suggested section is correct and user wants to modify this section in the future.\n"
-        "- edit_section: User wants to edit the currently selected section.\n"
-        "- continue_editing: User wants to make further changes to the current section.\n"
-        "- reject_change: User wants to discard the last proposed change.\n"
-        "- accept_change: User wants to accept and apply the last proposed change.\n"
-        "- download_document: User wants to download the document.\n"
-        "- export_document: User wants to export the document in another format.\n"
-        "- chat: General conversation or unclear intent.\n"
-        "Always respond with ONLY the intent word from the list above. "
-        f"User message: \"{prompt}\""
-    )
-    config = {"configurable": {"thread_id": "intent_classifying"}}
-    response = agent.invoke({"messages": [HumanMessage(content=instruction)]}, config=config)
-    content = response.get("messages")[-1].content
-    # Clean up and return only the intent word (lowercase, no punctuation)
-    intent = content.strip().lower().replace(".", "")
-    # Validate output
-    valid_intents = {
-        "create_document", "upload_document", "generate_outline", "select_section",
-        "suggest_section", "confirm_section", "edit_section", "continue_editing",
-        "reject_change", "accept_change", "download_document", "export_document", "chat"
-    }
-    if intent not in valid_intents:
-        return "chat"
-    return intent
-
-def edit_docx(docx_path, para_idx, new_text):
-    doc = DocxDocument(docx_path)
-    para = doc.paragraphs[para_idx]
-    para.text = new_text
-    doc.save(docx_path)
-
-def classify_intent(agent, prompt: str) -> str:
-    instruction = (
-        "You are an intent classifier for an AI-powered document editing assistant. "
-        "Given the user's chat message and the current workflow, classify the user's intent as one of the following: "
-        "[create_document, upload_document, generate_outline, select_section, suggest_section, confirm_section, "
-        "edit_section, continue_editing, reject_change, accept_change, download_document, export_document, chat].\n"
-        "Definitions:\n"
-        "- create_document: User wants to start a new document from scratch.\n"
-        "- upload_document: User wants to edit current uploading document.\n"
-        "- generate_outline: User wants the AI to generate a draft/outline.\n"
-        "- select_section: User wants to select or retrieve a section of the document.\n"
-        "- suggest_section: AI suggests a section to the user for confirmation.\n"
-        "- confirm_section: User confirms the suggested section is correct and user wants to modify this section in the future.\n"
-        "- edit_section: User wants to edit the currently selected section.\n"
-        "- continue_editing: User wants to make further changes to the current section.\n"
-        "- reject_change: User wants to discard the last proposed change.\n"
-        "- accept_change: User wants to accept and apply the last proposed change.\n"
-        "- download_document: User wants to download the document.\n"
-        "- export_document: User wants to export the document in another format.\n"
-        "- chat: General conversation or unclear intent.\n"
-        "Always respond with ONLY the intent word from the list above. "
-        f"User message: \"{prompt}\""
-    )
-    config = {"configurable": {"thread_id": "intent_classifying"}}
-    response = agent.invoke({"messages": [HumanMessage(content=instruction)]}, config=config)
-    content = response.get("messages")[-1].content
-    # Clean up and return only the intent word (lowercase, no punctuation)
-    intent = content.strip().lower().replace(".", "")
-    # Validate output
-    valid_intents = {
-        "create_document", "upload_document", "generate_outline", "select_section",
-        "suggest_section", "confirm_section", "edit_section", "continue_editing",
-        "reject_change", "accept_change", "download_document", "export_document", "chat"
-    }
-    if intent not in valid_intents:
-        return "chat"
-    return intent
-
-def load_documents(file_path: str):
-    if file_path.lower().endswith(".pdf"):
-        docs = []
-
-        # If there are images in the PDF, process them using OCR
-        print("Extracting images from PDF and performing OCR...")
-        doc = pymupdf.open(file_path)
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
 
-            # Extract text from the page
-            text = page.get_text()
-            docs.append(Document(page_content=text))
+def save_current_docx(user_id: str, data: bytes) -> str:
+    return downloads_store.save_current(user_id, data)
 
-            # Extract images from the page
-            img_list = page.get_images(full=True)
-            for img_index, img in enumerate(img_list):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
+def download_etag(filename: str):
+    return downloads_store.etag(filename)
 
-                # Convert image bytes to PIL Image for OCR
-                image = Image.open(io.BytesIO(image_bytes))
+def edit_docx(docx_path, changes):
+    return docx_cache.apply_edits(docx_path, changes)
+
+def apply_pending_edit(user_id: str) -> int:
+    # Writes an accepted edit into the user's current DOCX, every changed
+    # paragraph of the selection in one save
+    edit_info = get_pending_edits(user_id)
+    docx_path = os.path.join("downloads", f"{user_id}_current.docx")
+    if not edit_info or not edit_info.get("new_content") or not os.path.exists(docx_path):
+        return 0
+    orig_text = edit_info["content"]
+    new_text = edit_info["new_content"]
+    para_start = docx_cache.find_section(docx_path, orig_text)
+    if para_start < 0 or len(orig_text) != len(new_text):
+        return 0
+    changes = [
+        {"para_idx": para_start + i, "new_text": text}
+        for i, text in enumerate(new_text)
+    ]
+    return edit_docx(docx_path, changes)
+
+agent_cache = AgentCache(max_entries=int(os.environ.get("AGENT_CACHE_SIZE", "256")))
+
+def build_agent(user_id: str):
+    vector_store = get_vector_store(user_id)
+
+    tools = []
+    if vector_store is not None:
+        retriever = vector_store.as_retriever()
+
+        ### Build retriever tool ###
+        tool = create_retriever_tool(
+            retriever,
+            user_id,
+            "Independent chat room"
+        )
+        tools = [tool]
+    else:
+        print("Index is still provisioning, answering without retrieval")
 
-                # Run OCR on the image
-                text_from_image = pytesseract.image_to_string(image)
+    # History comes from conversation_store, so the graph itself is stateless
+    with span("build_agent"):
+        return create_react_agent(llm, tools)
 
-                # Optionally, append OCR-extracted text as a document
-                docs.append(Document(page_content=text_from_image))
+def get_agent(user_id: str):
+    # The key changes once a provisioning index becomes ready, which rebuilds
+    # the agent with the retriever tool
+    if vector_backend == "local":
+        key = (user_id, "local")
+    else:
+        index = get_user_index(user_id)
+        key = (user_id, index_registry.index_name(user_id) if index is not None else None)
+    return agent_cache.get(key, lambda: build_agent(user_id))
+
+def invalidate_agent(user_id: str):
+    if vector_backend != "local":
+        index_registry.invalidate(user_id)
+    agent_cache.invalidate(user_id)
+
+intent_classifier = IntentClassifier(embeddings, llm)
+edit_engine = EditEngine(llm, conversation_store.count_tokens)
+
+def classify_intent(prompt: str) -> str:
+    with span("classify_intent"):
+        return intent_classifier.classify(prompt)
+
+def use_backends(chat_model=None, embedding=None, pinecone_client=None):
+    # Swaps the chat model, embeddings or Pinecone client, along with
+    # everything built from them (offline benchmarks run on local stand-ins)
+    global llm, embeddings, pc, index_registry, intent_classifier, agent_cache
+    if chat_model is not None:
+        llm = chat_model
+    if embedding is not None:
+        embeddings = embedding
+    if pinecone_client is not None:
+        pc = pinecone_client
+        index_registry = IndexRegistry(
+            pc, mode=index_registry.mode, shared_index=index_registry.shared_index, ttl=index_registry.ttl
+        )
+    intent_classifier = IntentClassifier(embeddings, llm)
+    edit_engine.llm = llm
+    agent_cache = AgentCache(max_entries=agent_cache.max_entries)
 
-        return docs
+def load_documents(file_path: str):
+    # Yields lists of Documents, PDFs a few pages at a time
+    if file_path.lower().endswith(".pdf"):
+        print("Extracting text and images from PDF and performing OCR...")
+        stats = {}
+        yield from iter_pdf(file_path, stats=stats)
+        print(f"PDF extraction stats: {stats}")
     elif file_path.lower().endswith((".png", ".jpg", ".jpeg")):
         print("Using OCR to extract text from image")
-        image = Image.open(file_path)
-        text = pytesseract.image_to_string(image)
-        return [Document(page_content=text)]
+        yield extract_image(file_path)
     else:
         print("Unsupported file format")
-        return []
 
-pending_edits = {}
+# Pending edits live in the shared session store so any worker can serve /apply_change
+session_store = make_session_store()
 
-def get_docx_sections(docx_path):
-    doc = DocxDocument(docx_path)
-    return [para.text for para in doc.paragraphs]
+def _pending_edit_key(user_id: str) -> str:
+    return f"pending_edit:{user_id}"
 
-def invoke_stream(question: str, user_id: str, file_path: str, start: str, end: str, content: list[str]):
-    if start and end and content:
-        pending_edits[user_id] = {
-            "start": start,
-            "end": end,
-            "content": content,
-            "new_content": None,
-        }
+def get_docx_sections(docx_path):
+    return docx_cache.paragraphs(docx_path)
+
+# Bump when extraction output changes, so cached parses are not reused
+EXTRACTOR_VERSION = "1"
+
+def extract_documents(file_path: str, file_hash: str = None):
+    # Yields lists of Documents as they are extracted, the parse cache gets
+    # the whole file once extraction is done
+    _, ext = os.path.splitext(file_path)
+    if file_hash:
+        docs = load_parsed(file_hash, ext, EXTRACTOR_VERSION)
+        if docs is not None:
+            print("Using cached extraction of the file")
+            yield docs
+            return
 
-    if os.path.exists(file_path):
-        print("Loading and chunking contents of the file")
-        if file_path.endswith(".doc") or file_path.endswith(".docx"):
-            docs = DocxDocument(file_path)
-            docs = [Document(page_content=para.text) for para in docs.paragraphs]
-        else:
-            docs = load_documents(file_path)
+    if file_path.endswith(".doc") or file_path.endswith(".docx"):
+        batches = [[Document(page_content=text) for text in docx_cache.paragraphs(file_path)]]
     else:
-        docs = []
+        batches = load_documents(file_path)
+
+    docs = []
+    for batch in batches:
+        docs.extend(batch)
+        yield batch
 
-    index = get_user_index(user_id)
+    if file_hash:
+        store_parsed(file_hash, ext, EXTRACTOR_VERSION, docs)
 
-    vector_store = PineconeVectorStore(index=index, embedding=embeddings)
+text_splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=200)
 
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1024, chunk_overlap=200)
-    all_splits = text_splitter.split_documents(docs)
+def split_documents(docs):
+    return text_splitter.split_documents(docs)
 
+def label_sections(all_splits):
     # Update metadata (illustration purposes)
     total_documents = len(all_splits)
     third = total_documents // 3
@@ -269,80 +289,187 @@ def invoke_stream(question: str, user_id: str, file_path: str, start: str, end:
             document.metadata["section"] = "middle"
         else:
             document.metadata["section"] = "end"
+    return all_splits
 
-
-    print("Indexing chunks")
-    _ = vector_store.add_documents(all_splits)
-    print("Indexing finished!")
-
-    retriever = vector_store.as_retriever()
-
-    ### Build retriever tool ###
-    tool = create_retriever_tool(
-        retriever,
+def ingest_file(user_id: str, file_path: str, source: str = "", file_hash: str = None):
+    return start_ingest(
         user_id,
-        "Independent chat room"
+        source or os.path.basename(file_path),
+        vector_index_key(user_id),
+        loader=lambda: extract_documents(file_path, file_hash),
+        splitter=split_documents,
+        label=label_sections,
+        get_store=lambda: get_vector_store(user_id, timeout=provision_timeout),
+        embeddings=embeddings,
+        file_hash=file_hash,
     )
-    tools = [tool]
 
-    agent_executor = create_react_agent(llm, tools, checkpointer=memory)
-    config = {"configurable": {"thread_id": user_id}}
+def get_ingest_status(user_id: str, job_id: str = None):
+    if job_id:
+        job = get_job(job_id)
+        return [job.to_dict()] if job and job.user_id == user_id else []
+    return [job.to_dict() for job in user_jobs(user_id)]
+
+gen_guide = (
+    "You're an AI assistant helping user write the document."
+    "If the user wants to generate or edit a document file, "
+    "include ONLY the formal document content between the --- and --- markers. "
+    "Do NOT break the markers across multiple tokens or stream them character-by-character. "
+    "Only wrap formal document content in these markers. Keep anything else outside."
+    "Format the document with proper headings, bullet points, or numbered sections if needed. \n\n"
+)
+guide = (
+    "You are an AI assistant for document editing. Your job is to help the user select, review, and edit sections of a document interactively. Follow these instructions for all interactions:\n\n"
+    "1. **Section Selection**\n"
+    "   - If the user asks to select or review a section, analyze the document structure and their request.\n"
+    "   - Identify the most relevant section or paragraph.\n"
+    "   - Clearly display the selected section's content to the user, including its index or identifier if possible.\n"
+
+    "2. **Editing**\n"
+    "   - If the user provides an edit instruction (e.g., \"make this more concise\", \"change the tone\", etc.), apply the requested changes ONLY to the previously selected or discussed section.\n"
+    "   - Present the revised text clearly, and mark it as the new version for that section.\n"
+
+    "3. **Confirmation**\n"
+    "   - After suggesting an edit, always ask the user if they want to accept or reject the change.\n"
+    "   - If the user accepts, confirm the change and state that it will be applied to the document.\n"
+    "   - If the user rejects, revert to the previous version and ask for further instructions if needed.\n"
+
+    "4. **Formatting**\n"
+    "   - When returning edited document content, always wrap the formal document content between lines containing only three dashes (`---`), with nothing else on those lines. Do not break the marker across multiple tokens or stream it character by character.\n"
+    "   - All other explanations, confirmations, or questions should be outside the `---` markers.\n"
+    "   - Do not format the document.\n"
+
+    "5. **State Management**\n"
+    "   - Remember the current section being discussed and its latest version based on the conversation history.\n"
+    "   - Do not ask the user to repeat information already provided in the chat history.\n"
+
+    "6. **Examples:**\n"
+    "   - User: \"Edit the introduction to be more formal.\""
+    '- AI: "Here is the revised introduction:\n---\n[Revised introduction text]\n---\nWould you like to accept this change?"'
+
+    '- User: "Yes, apply it."'
+    '- AI: "✅ Change applied to the introduction. Let me know if you want to edit another section."'
+
+    '- User: "No, revert."'
+    '- AI: "❌ Change discarded. The introduction remains as before. What would you like to do next?"'
+
+    "7. **General Rules:**\n"
+    "- Always be clear about which section you are editing.\n"
+    "- Always use the `---` markers for document content.\n"
+    "- Never lose track of the current section or the user's last instruction.\n"
+    "- If unsure, ask clarifying questions.\n"
+)
+
+class TurnOutput:
+    # Turns a turn's output into what the client sees: document bodies
+    # between --- markers in the agent's stream are saved as a whole, edited
+    # paragraphs are shown batch by batch and kept as the pending edit
+    def __init__(self, user_id: str, question: str, intent: str, download_flag: bool, timings: RequestTimings = None):
+        self.user_id = user_id
+        self.question = question
+        self.intent = intent
+        self.download_flag = download_flag
+        # Without a download there are no documents, --- is plain text
+        self.parser = MarkerParser() if download_flag else None
+        self.reply = []
+        self.timings = timings
+        self.revised = []
+        self.unchanged = 0
+
+    def parse(self, content: str) -> list:
+        self.reply.append(content)
+        if self.parser is None:
+            return [("text", content)]
+        return self.parser.feed(content)
+
+    def needs_executor(self, events: list) -> bool:
+        # Finished documents save a DOCX, plain text is cheap
+        return any(kind == "document" for kind, _ in events)
+
+    def render(self, events: list) -> list[str]:
+        out = []
+        for kind, text in events:
+            if kind == "text":
+                out.append(text)
+            elif self.download_flag:
+                with span("save_docx", self.timings):
+                    download_url = save_docx_file(text.strip(), self.user_id)
+                out.append(f'\n[📄 Download your DOCX]({download_url})\n')
+        return out
+
+    def edited(self, paragraphs: list[str], ok: bool) -> list[str]:
+        # No --- markers around the paragraphs, Markdown renders a --- right
+        # after a paragraph as a heading underline
+        piece = ("\r\n" if self.revised else "") + "\r\n".join(paragraphs)
+        self.revised.extend(paragraphs)
+        if not ok:
+            self.unchanged += len(paragraphs)
+        self.reply.append(piece)
+        return [piece]
+
+    def edit_done(self) -> list[str]:
+        revised = self.revised
+        session_store.update(
+            _pending_edit_key(self.user_id),
+            lambda edit_info: {**(edit_info or {}), "new_content": revised},
+        )
+        piece = "\n\n"
+        if self.unchanged:
+            piece += f"{self.unchanged} paragraph(s) could not be revised and were left as they were.\n"
+        piece += "Would you like to accept or reject this change?"
+        self.reply.append(piece)
+        return [piece]
+
+    def feed(self, content: str) -> list[str]:
+        return self.render(self.parse(content))
+
+    def finish(self) -> list[str]:
+        out = self.render(self.parser.finish() if self.parser is not None else [])
+
+        # Only the user's own words are kept, the guide preambles are not worth replaying
+        conversation_store.append(self.user_id, "human", self.question)
+        conversation_store.append(self.user_id, "ai", "".join(self.reply))
+
+        if self.intent in ["edit_section", "continue_editing"]:
+            backend_url = os.environ.get('NEXT_PUBLIC_BACKEND_URL', 'http://localhost:5000')
+            content_url = f"{backend_url}/apply_change?user_id={self.user_id}"
+            out.append(f"\nApply your change({content_url})")
+        return out
+
+def prepare_turn(question: str, user_id: str, file_path: str, start: str, end: str, content: list[str], source: str = "", wait_for_index: bool = True, file_hash: str = None) -> dict:
+    # Everything before the first token: ingestion, agent lookup, intent and prompt.
+    # Returns {"message": ...} when the turn ends without calling the agent.
+    timings = RequestTimings()
+    with track(timings):
+        turn = _prepare_turn(question, user_id, file_path, start, end, content, source, wait_for_index, file_hash, timings)
+    turn["timings"] = timings
+    return turn
+
+def _prepare_turn(question: str, user_id: str, file_path: str, start: str, end: str, content: list[str], source: str, wait_for_index: bool, file_hash: str, timings: RequestTimings) -> dict:
+    if start and end and content:
+        session_store.set(_pending_edit_key(user_id), {
+            "start": start,
+            "end": end,
+            "content": content,
+            "new_content": None,
+        })
+
+    if os.path.exists(file_path):
+        print("Loading and chunking contents of the file")
+        job = ingest_file(user_id, file_path, source, file_hash)
+        if wait_for_index:
+            with span("ingest_wait"):
+                job.wait()
+        else:
+            print(f"Indexing {job.source} in the background (job {job.id})")
+
+        if job.status == "failed":
+            # The cached index handle may be gone, resolve it again next time
+            invalidate_agent(user_id)
 
-    full_content = ""  # <-- Accumulate content here
-    gen_guide = (
-        "You're an AI assistant helping user write the document."
-        "If the user wants to generate or edit a document file, "
-        "include ONLY the formal document content between the --- and --- markers. "
-        "Do NOT break the markers across multiple tokens or stream them character-by-character. "
-        "Only wrap formal document content in these markers. Keep anything else outside."
-        "Format the document with proper headings, bullet points, or numbered sections if needed. \n\n"
-    )
-    guide = (
-        "You are an AI assistant for document editing. Your job is to help the user select, review, and edit sections of a document interactively. Follow these instructions for all interactions:\n\n"
-        "1. **Section Selection**\n"
-        "   - If the user asks to select or review a section, analyze the document structure and their request.\n"
-        "   - Identify the most relevant section or paragraph.\n"
-        "   - Clearly display the selected section's content to the user, including its index or identifier if possible.\n"
-
-        "2. **Editing**\n"
-        "   - If the user provides an edit instruction (e.g., \"make this more concise\", \"change the tone\", etc.), apply the requested changes ONLY to the previously selected or discussed section.\n"
-        "   - Present the revised text clearly, and mark it as the new version for that section.\n"
-
-        "3. **Confirmation**\n"
-        "   - After suggesting an edit, always ask the user if they want to accept or reject the change.\n"
-        "   - If the user accepts, confirm the change and state that it will be applied to the document.\n"
-        "   - If the user rejects, revert to the previous version and ask for further instructions if needed.\n"
-
-        "4. **Formatting**\n"
-        "   - When returning edited document content, always wrap the formal document content between lines containing only three dashes (`---`), with nothing else on those lines. Do not break the marker across multiple tokens or stream it character by character.\n"
-        "   - All other explanations, confirmations, or questions should be outside the `---` markers.\n"
-        "   - Do not format the document.\n"
-
-        "5. **State Management**\n"
-        "   - Remember the current section being discussed and its latest version based on the conversation history.\n"
-        "   - Do not ask the user to repeat information already provided in the chat history.\n"
-
-        "6. **Examples:**\n"
-        "   - User: \"Edit the introduction to be more formal.\""
-        '- AI: "Here is the revised introduction:\n---\n[Revised introduction text]\n---\nWould you like to accept this change?"'
-
-        '- User: "Yes, apply it."'
-        '- AI: "✅ Change applied to the introduction. Let me know if you want to edit another section."'
-
-        '- User: "No, revert."'
-        '- AI: "❌ Change discarded. The introduction remains as before. What would you like to do next?"'
-
-        "7. **General Rules:**\n"
-        "- Always be clear about which section you are editing.\n"
-        "- Always use the `---` markers for document content.\n"
-        "- Never lose track of the current section or the user's last instruction.\n"
-        "- If unsure, ask clarifying questions.\n"
-    )
-    doc_writing_flag = False
-    edit_flag = False
     download_flag = False
     prompt = question
-    intent = classify_intent(agent_executor, question)
+    intent = classify_intent(question)
     if intent in ["create_document", "download_document", "export_document"]:
         prompt = gen_guide + question
         download_flag = True
@@ -350,54 +477,170 @@ def invoke_stream(question: str, user_id: str, file_path: str, start: str, end:
         temp_content_str = "\n".join(content) + "\n"
         prompt = guide + "\n\nHere's the content of the selected document: \n\n" + temp_content_str + question
 
-    if intent in ["edit_section", "continue_editing"]:
-        edit_info = pending_edits.get(user_id)
-        if not edit_info or "content" not in edit_info:
-            yield "Please select a section you want to edit."
-            return
-        
-        orig_text = edit_info["content"]
-        prompt = (
-            "You are an AI assistant for document editing. "
-            "The user wants to edit a section or paragraph of a document."
-            "The original content is provided as a list of paragraphs (in JSON array format). "
-            "Edit each paragraph as needed according to the user's instruction, but do not merge or split paragraphs. "
-            "Return ONLY the revised paragraphs as a JSON array, preserving the number and order of paragraphs. "
-            "Do NOT include any explanations, just the JSON array between lines containing only three dashes (`---`). "
-            "Do NOT break the markers across multiple tokens or stream them character by character."
-            "\n\n"
-            f"Edit the following content according to the instruction: {question}\nParagraph list: {json.dumps(orig_text)}\n"
-            "After presenting the revised content, ask the user if they want to accept or reject this change."
-        )
-        edit_flag = True
-
-    for message_chunk, metadata in agent_executor.stream(
-        {"messages": [HumanMessage(content=prompt)]}, config=config, stream_mode="messages"
-    ):
-        if message_chunk.content and metadata["langgraph_node"] == "agent":
-            content = message_chunk.content
-            if download_flag and "---" == content.strip() and doc_writing_flag:
-                doc_writing_flag = False
-                download_url = save_docx_file(full_content.strip(), user_id)
-                download_link = f'\n[📄 Download your DOCX]({download_url})'
-                full_content = ""
-                yield download_link
-            if "---" == content.strip() and edit_flag and doc_writing_flag:
-                doc_writing_flag = False
-                pending_edits[user_id]["new_content"] = json.loads(full_content)
-                full_content = ""
-                yield "\r\n".join(pending_edits[user_id]["new_content"])
-            if doc_writing_flag:
-                full_content += content
-            elif "---" != content.strip() or download_flag == False:
-                yield content
-            if (edit_flag or download_flag) and "---" == content.strip():
-                doc_writing_flag = True
+    if intent == "accept_change":
+        with span("apply_edit"):
+            changed = apply_pending_edit(user_id)
+        print(f"Applied {changed} paragraph changes to the current document")
 
     if intent in ["edit_section", "continue_editing"]:
-        backend_url = os.environ.get('NEXT_PUBLIC_BACKEND_URL', 'http://localhost:5000')
-        content_url = f"{backend_url}/apply_change?user_id={user_id}"
-        yield f"\nApply your change({content_url})"
+        edit_info = get_pending_edits(user_id)
+        if not edit_info or not edit_info.get("content"):
+            return {"message": "Please select a section you want to edit."}
+
+        # Further changes build on the last proposal, it has the same paragraphs
+        paragraphs = edit_info["content"]
+        if intent == "continue_editing" and edit_info.get("new_content"):
+            paragraphs = edit_info["new_content"]
+        return {
+            "edit": {"instruction": question, "paragraphs": paragraphs},
+            "output": TurnOutput(user_id, question, intent, download_flag, timings),
+        }
+
+    agent_executor = get_agent(user_id)
+    config = {"configurable": {"thread_id": user_id}}
+    with span("history"):
+        history = conversation_store.history(user_id)
+    return {
+        "agent": agent_executor,
+        "config": config,
+        "messages": history + [HumanMessage(content=prompt)],
+        "output": TurnOutput(user_id, question, intent, download_flag, timings),
+    }
+
+def finish_turn(turn: dict) -> list[str]:
+    output = turn["output"]
+    timings = turn["timings"]
+    with span("finish", timings):
+        pieces = output.finish()
+
+    # Counted after the reply is streamed, so tokenizing never delays it.
+    # The edit engine counts its own calls.
+    if "messages" in turn:
+        metrics.llm_tokens.inc(sum(conversation_store.count_tokens(message.content) for message in turn["messages"]), direction="in")
+        metrics.llm_tokens.inc(conversation_store.count_tokens("".join(output.reply)), direction="out")
+    return pieces
+
+def end_turn(turn: dict, first_frame: float):
+    output = turn["output"]
+    timings = turn["timings"]
+    metrics.turn_seconds.observe(time.perf_counter() - timings.started, intent=output.intent)
+    if metrics.TIMING_LOG:
+        ttft = f"{first_frame * 1000:.1f}ms" if first_frame is not None else "-"
+        print(f"Turn timing user={output.user_id} intent={output.intent} ttft={ttft} {timings.summary()}")
+
+def _first_frame(turn: dict, first_frame: float):
+    if first_frame is None:
+        first_frame = time.perf_counter() - turn["timings"].started
+        metrics.first_token_seconds.observe(first_frame, intent=turn["output"].intent)
+    return first_frame
+
+def invoke_stream(question: str, user_id: str, file_path: str, start: str, end: str, content: list[str], source: str = "", wait_for_index: bool = True, file_hash: str = None):
+    turn = prepare_turn(question, user_id, file_path, start, end, content, source, wait_for_index, file_hash)
+    if "message" in turn:
+        yield turn["message"]
+        return
+
+    output = turn["output"]
+    frames = FrameCoalescer()
+    first_frame = None
+    if "edit" in turn:
+        with span("edit_stream", turn["timings"]):
+            for _, paragraphs, ok in edit_engine.stream(**turn["edit"]):
+                # Each batch goes out whole as soon as it and the ones before it are ready
+                for piece in output.edited(paragraphs, ok):
+                    frames.add(piece)
+                frame = frames.flush()
+                if frame:
+                    first_frame = _first_frame(turn, first_frame)
+                    yield frame
+        for piece in output.edit_done():
+            frames.add(piece)
+    else:
+        with span("agent_stream", turn["timings"]):
+            for message_chunk, metadata in turn["agent"].stream(
+                {"messages": turn["messages"]}, config=turn["config"], stream_mode="messages"
+            ):
+                if message_chunk.content and metadata["langgraph_node"] == "agent":
+                    for piece in output.feed(message_chunk.content):
+                        frame = frames.push(piece)
+                        if frame:
+                            first_frame = _first_frame(turn, first_frame)
+                            yield frame
+    for piece in finish_turn(turn):
+        frames.add(piece)
+    frame = frames.flush()
+    if frame:
+        first_frame = _first_frame(turn, first_frame)
+    end_turn(turn, first_frame)
+    if frame:
+        yield frame
+
+async def ainvoke_stream(question: str, user_id: str, file_path: str, start: str, end: str, content: list[str], source: str = "", wait_for_index: bool = True, file_hash: str = None, executor=None):
+    # asyncio twin of invoke_stream: the agent streams natively, blocking
+    # work (OCR, DOCX, SQLite) runs on `executor`
+    loop = asyncio.get_running_loop()
+    turn = await loop.run_in_executor(
+        executor, lambda: prepare_turn(question, user_id, file_path, start, end, content, source, wait_for_index, file_hash)
+    )
+    if "message" in turn:
+        yield turn["message"]
+        return
+
+    output = turn["output"]
+    frames = FrameCoalescer()
+    first_frame = None
+    if "edit" in turn:
+        with span("edit_stream", turn["timings"]):
+            async for _, paragraphs, ok in edit_engine.astream(**turn["edit"]):
+                for piece in output.edited(paragraphs, ok):
+                    frames.add(piece)
+                frame = frames.flush()
+                if frame:
+                    first_frame = _first_frame(turn, first_frame)
+                    yield frame
+        for piece in await loop.run_in_executor(executor, output.edit_done):
+            frames.add(piece)
+    else:
+        with span("agent_stream", turn["timings"]):
+            async for message_chunk, metadata in turn["agent"].astream(
+                {"messages": turn["messages"]}, config=turn["config"], stream_mode="messages"
+            ):
+                if message_chunk.content and metadata["langgraph_node"] == "agent":
+                    events = output.parse(message_chunk.content)
+                    if output.needs_executor(events):
+                        pieces = await loop.run_in_executor(executor, output.render, events)
+                    else:
+                        pieces = output.render(events)
+                    for piece in pieces:
+                        frame = frames.push(piece)
+                        if frame:
+                            first_frame = _first_frame(turn, first_frame)
+                            yield frame
+    for piece in await loop.run_in_executor(executor, finish_turn, turn):
+        frames.add(piece)
+    frame = frames.flush()
+    if frame:
+        first_frame = _first_frame(turn, first_frame)
+    end_turn(turn, first_frame)
+    if frame:
+        yield frame
+
+def get_conversation_stats(user_id: str):
+    return conversation_store.thread_stats(user_id)
 
 def get_pending_edits(user_id: str):
-    return pending_edits[user_id]
+    return session_store.get(_pending_edit_key(user_id))
+
+# Cache and store counters, read when /metrics is scraped. Lambdas so
+# use_backends() swaps are picked up.
+metrics.register_collector("embedding_cache", lambda: embeddings.stats())
+metrics.register_collector("agent_cache", lambda: agent_cache.stats())
+metrics.register_collector("intent", lambda: dict(intent_classifier.counts))
+metrics.register_collector("edit_engine", edit_engine.stats)
+metrics.register_collector("session_store", session_store.stats)
+metrics.register_collector("docx_cache", docx_cache.stats)
+metrics.register_collector("downloads", lambda: {"evicted": downloads_store.evicted})
+metrics.register_collector("conversations", conversation_store.stats)
+
+def get_metrics() -> str:
+    return metrics.render()
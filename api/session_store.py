@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SESSION_BACKEND = os.environ.get("SESSION_BACKEND", "sqlite")
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", os.path.join("data", "sessions.sqlite3"))
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "86400"))
+SESSION_MAX_ENTRIES = int(os.environ.get("SESSION_MAX_ENTRIES", "10000"))
+SWEEP_INTERVAL_SECONDS = 60
+
+
+class _KeyLocks:
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key: str):
+        with self._guard:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._guard:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class MemorySessionStore:
+    # In-process LRU with a TTL, for a single worker
+    def __init__(self, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.metrics = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0}
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._key_locks = _KeyLocks()
+
+    def _get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics["misses"] += 1
+                return None
+            value, expires = entry
+            if expires <= time.time():
+                del self._entries[key]
+                self.metrics["expired"] += 1
+                self.metrics["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.metrics["hits"] += 1
+            return value
+
+    def _set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl)
+            self._entries.move_to_end(key)
+            self.metrics["writes"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    def get(self, key: str):
+        return self._get(key)
+
+    def set(self, key: str, value):
+        with self._key_locks.hold(key):
+            self._set(key, value)
+
+    def update(self, key: str, fn):
+        # fn(old value or None) -> new value, atomic per key
+        with self._key_locks.hold(key):
+            value = fn(self._get(key))
+            self._set(key, value)
+            return value
+
+    def delete(self, key: str):
+        with self._key_locks.hold(key), self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "memory", "entries": len(self._entries), **self.metrics}
+
+
+class SqliteSessionStore:
+    # Shared by every worker process on the host through one WAL database.
+    # Inside a process each thread has its own connection and writers take a
+    # per-key lock, so reads never wait and users do not queue behind each
+    # other. Across processes update() runs in a BEGIN IMMEDIATE transaction:
+    # SQLite's write lock covers the whole database, but it is held only for
+    # one read and one write of a small row.
+    def __init__(self, path: str = SESSION_DB_PATH, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.metrics = {"hits": 0, "misses": 0, "writes": 0, "expired": 0, "evicted": 0}
+        self._metrics_lock = threading.Lock()
+        self._key_locks = _KeyLocks()
+        self._local = threading.local()
+        self._last_sweep = 0.0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = self._connection()
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT, expires REAL, updated REAL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS sessions_expires ON sessions(expires)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _count(self, key: str, amount: int = 1):
+        with self._metrics_lock:
+            self.metrics[key] += amount
+
+    def _read(self, key: str):
+        row = self._connection().execute(
+            "SELECT value FROM sessions WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def _write(self, key: str, value):
+        now = time.time()
+        self._connection().execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + self.ttl, now),
+        )
+        self._count("writes")
+
+    def _sweep(self):
+        now = time.time()
+        if now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+            return
+        self._last_sweep = now
+        db = self._connection()
+        self._count("expired", db.execute("DELETE FROM sessions WHERE expires <= ?", (now,)).rowcount)
+        # Least recently updated sessions go first once the table is over capacity
+        self._count("evicted", db.execute(
+            "DELETE FROM sessions WHERE key IN ("
+            "SELECT key FROM sessions ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        ).rowcount)
+
+    def get(self, key: str):
+        return self._read(key)
+
+    def set(self, key: str, value):
+        with self._key_locks.hold(key):
+            self._write(key, value)
+        self._sweep()
+
+    def update(self, key: str, fn):
+        # fn(old value or None) -> new value, atomic per key across processes
+        with self._key_locks.hold(key):
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                value = fn(self._read(key))
+                self._write(key, value)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        self._sweep()
+        return value
+
+    def delete(self, key: str):
+        with self._key_locks.hold(key):
+            self._connection().execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        entries = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        with self._metrics_lock:
+            return {"backend": "sqlite", "entries": entries, **self.metrics}
+
+
+def make_session_store():
+    if SESSION_BACKEND == "memory":
+        return MemorySessionStore()
+    return SqliteSessionStore()
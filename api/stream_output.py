@@ -0,0 +1,123 @@
+import os
+import time
+
+MARKER = "---"
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "256"))
+FLUSH_SECONDS = float(os.environ.get("STREAM_FLUSH_SECONDS", "0.05"))
+
+
+def _could_be_marker(line: str) -> bool:
+    # True while `line` may still grow into a line holding only ---
+    stripped = line.strip(" \t\r")
+    return len(stripped) <= len(MARKER) and stripped == "-" * len(stripped)
+
+
+class MarkerParser:
+    # Incremental state machine that splits model output into plain text and
+    # document bodies wrapped in lines holding only ---. Markers are found even
+    # when the model streams them across several chunks. Only a line prefix that
+    # could still turn into a marker is held back, everything else is emitted
+    # as soon as it arrives.
+    def __init__(self):
+        self.inside = False
+        self._at_line_start = True
+        self._held = ""
+        self._parts = []
+
+    def _emit(self, events: list, text: str):
+        if not text:
+            return
+        if self.inside:
+            self._parts.append(text)
+        elif events and events[-1][0] == "text":
+            events[-1] = ("text", events[-1][1] + text)
+        else:
+            events.append(("text", text))
+
+    def _toggle(self, events: list):
+        if self.inside:
+            events.append(("document", "".join(self._parts)))
+            self._parts = []
+        self.inside = not self.inside
+
+    def feed(self, chunk: str) -> list:
+        events = []
+        text = self._held + chunk
+        self._held = ""
+        pos = 0
+        end = len(text)
+        while pos < end:
+            newline = text.find("\n", pos)
+            line_end = end if newline == -1 else newline + 1
+            if self._at_line_start:
+                line = text[pos:line_end]
+                if _could_be_marker(line.rstrip("\n")):
+                    if newline == -1:
+                        self._held = line
+                        break
+                    if line.strip() == MARKER:
+                        self._toggle(events)
+                        pos = line_end
+                        continue
+            self._emit(events, text[pos:line_end])
+            self._at_line_start = newline != -1
+            pos = line_end
+        return events
+
+    def finish(self) -> list:
+        events = []
+        if self._held:
+            if self._held.strip() == MARKER:
+                self._toggle(events)
+            else:
+                self._emit(events, self._held)
+            self._held = ""
+        if self.inside:
+            # Unterminated document, hand over whatever was written
+            if "".join(self._parts).strip():
+                self._toggle(events)
+            else:
+                self.inside = False
+                self._parts = []
+        return events
+
+
+class FrameCoalescer:
+    # Batches many tiny token writes into fewer, larger writes to the client.
+    # The first piece goes out at once. After that a frame goes out once it
+    # reaches max_bytes, or with the first piece that arrives max_delay
+    # seconds or more after the previous frame, so text that follows a pause
+    # is not held back.
+    def __init__(self, max_bytes: int = FLUSH_BYTES, max_delay: float = FLUSH_SECONDS):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self._parts = []
+        self._size = 0
+        self._flushed_at = None
+        self.frames = 0
+
+    def add(self, piece: str):
+        # Buffers without flushing, for callers that decide when to flush
+        if piece:
+            self._parts.append(piece)
+            self._size += len(piece)
+
+    def push(self, piece: str):
+        # Returns a frame to send, or None while it is still buffering
+        if not piece:
+            return None
+        self.add(piece)
+        if (self._flushed_at is None or self._size >= self.max_bytes
+                or time.monotonic() - self._flushed_at >= self.max_delay):
+            return self.flush()
+        return None
+
+    def flush(self):
+        if not self._parts:
+            return None
+        frame = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._flushed_at = time.monotonic()
+        self.frames += 1
+        return frame
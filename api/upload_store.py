@@ -0,0 +1,59 @@
+import os
+import json
+import hashlib
+import threading
+import xxhash
+import zstandard
+from langchain_core.documents import Document
+
+UPLOAD_FOLDER = os.path.join("data", "uploads")
+PARSED_FOLDER = os.path.join("data", "parsed")
+CHUNK_SIZE = 1024 * 1024
+
+
+def save_upload(stream, user_id: str, filename: str):
+    # Streams the upload to disk while hashing it, then files it under the
+    # user's folder by content hash. Returns (path, digest).
+    _, ext = os.path.splitext(filename)
+    ext = ext.lower()
+    user_folder = os.path.join(UPLOAD_FOLDER, hashlib.md5((user_id or "").encode()).hexdigest())
+    os.makedirs(user_folder, exist_ok=True)
+
+    hasher = xxhash.xxh3_128()
+    tmp_path = os.path.join(user_folder, f".upload.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "wb") as f:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            f.write(chunk)
+
+    digest = hasher.hexdigest()
+    path = os.path.join(user_folder, digest + ext)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, path)
+    return path, digest
+
+def _parsed_path(digest: str, ext: str, version: str) -> str:
+    return os.path.join(PARSED_FOLDER, f"{digest}{ext.lower()}.v{version}.json.zst")
+
+def load_parsed(digest: str, ext: str, version: str):
+    path = _parsed_path(digest, ext, version)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        rows = json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+    return [Document(page_content=row["page_content"], metadata=row["metadata"]) for row in rows]
+
+def store_parsed(digest: str, ext: str, version: str, docs):
+    os.makedirs(PARSED_FOLDER, exist_ok=True)
+    rows = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs]
+    data = zstandard.ZstdCompressor(level=3).compress(json.dumps(rows).encode())
+    path = _parsed_path(digest, ext, version)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
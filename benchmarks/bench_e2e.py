@@ -0,0 +1,385 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import traceback
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+# End-to-end benchmarks against local stand-ins for OpenAI and Pinecone, so
+# they run offline and give the same answers on every commit:
+#   python -m benchmarks.bench_e2e --output bench.json
+#   python -m benchmarks.bench_e2e --scenarios ttft,intent --vector-backend local
+# Everything runs in a scratch directory, the repo's data/ and downloads/
+# are never touched. Results are JSON on stdout (and in --output), logs go
+# to stderr.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ["ingestion", "ttft", "intent", "concurrency"]
+
+WORDS = [
+    "agreement", "party", "shall", "term", "notice", "payment", "clause", "liability",
+    "the", "of", "and", "to", "within", "days", "written", "consent", "services", "fees",
+]
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    pos = (len(ordered) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (pos - low)
+
+def summarize(seconds: list[float]) -> dict:
+    # Milliseconds, so runs on different commits can be diffed directly
+    if not seconds:
+        return {"n": 0}
+    ms = [s * 1000 for s in seconds]
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3),
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p90_ms": round(percentile(ms, 90), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3),
+    }
+
+def sentences(rng: random.Random, count: int) -> list[str]:
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 20))).capitalize() + "." for _ in range(count)]
+
+def text_image(text: str, size=(900, 300)) -> bytes:
+    from PIL import Image, ImageDraw
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(text.split("\n")):
+        draw.text((20, 20 + i * 24), line, fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def make_pdf(path: str, pages: int, seed: int = 0) -> str:
+    # Text on every page, the same small logo on every page (deduplicated and
+    # skipped as decorative) and a distinct figure with text every 5 pages
+    import pymupdf
+    rng = random.Random(seed)
+    logo = text_image("", size=(24, 24))
+    doc = pymupdf.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(pymupdf.Rect(72, 72, 540, 560), "\n\n".join(sentences(rng, 12)), fontsize=10)
+        page.insert_image(pymupdf.Rect(500, 20, 524, 44), stream=logo)
+        if page_num % 5 == 0:
+            figure = text_image("\n".join(sentences(rng, 4)))
+            page.insert_image(pymupdf.Rect(72, 580, 540, 740), stream=figure)
+    doc.save(path)
+    doc.close()
+    return path
+
+def make_image(path: str, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    with open(path, "wb") as f:
+        f.write(text_image("\n".join(sentences(rng, 10)), size=(1400, 300)))
+    return path
+
+def make_docx(path: str, paragraphs: int, seed: int = 0, changed: int = None) -> str:
+    from docx import Document as DocxDocument
+    rng = random.Random(seed)
+    doc = DocxDocument()
+    for i in range(paragraphs):
+        text = " ".join(sentences(rng, 3))
+        doc.add_paragraph(text + (" Amended." if i == changed else ""))
+    doc.save(path)
+    return path
+
+
+def setup(args):
+    # The real clients are built at import time, so they need keys even
+    # though the benchmark replaces them before any request is made
+    os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+    os.environ.setdefault("PINECONE_API_KEY", "offline-benchmark")
+    os.environ["VECTOR_BACKEND"] = args.vector_backend
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(args.workdir)
+
+    from api import server
+    from api.embedding_cache import CachedEmbeddings
+    from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakePinecone
+
+    fakes = {
+        "llm": FakeChatModel(
+            first_token_latency=args.llm_first_token_ms / 1000,
+            token_latency=args.llm_token_ms / 1000,
+        ),
+        "embeddings": FakeEmbeddings(latency=args.embed_ms / 1000, per_text_latency=args.embed_per_text_ms / 1000),
+        "pc": FakePinecone(latency=args.pinecone_ms / 1000, provision_delay=args.provision_ms / 1000),
+    }
+    server.use_backends(
+        chat_model=fakes["llm"],
+        embedding=CachedEmbeddings(fakes["embeddings"], model="fake-embedding"),
+        pinecone_client=fakes["pc"],
+    )
+    return server, fakes
+
+
+def ingest_once(server, fakes, user_id: str, path: str) -> dict:
+    from api.upload_store import save_upload
+    calls = fakes["embeddings"].calls
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        file_path, file_hash = save_upload(f, user_id, os.path.basename(path))
+    job = server.ingest_file(user_id, file_path, os.path.basename(path), file_hash)
+    job.wait()
+    if job.status == "failed":
+        raise RuntimeError(f"Ingesting {os.path.basename(path)} failed: {job.error}")
+    seconds = time.perf_counter() - started
+    size = os.path.getsize(path)
+    return {
+        "seconds": round(seconds, 4),
+        "mb_per_second": round(size / 1e6 / max(seconds, 1e-9), 3),
+        "embedding_api_calls": fakes["embeddings"].calls - calls,
+        **{key: value for key, value in job.to_dict().items() if key not in ("job_id", "source", "created_at", "finished_at")},
+    }
+
+def bench_ingestion(server, fakes, args) -> dict:
+    # cold: nothing cached. same_file: identical bytes again, skipped by hash.
+    # other_user: same file for a new user, parse and embedding caches are warm.
+    fixtures = os.path.join(args.workdir, "fixtures")
+    os.makedirs(fixtures, exist_ok=True)
+    builders = {
+        "pdf": lambda: make_pdf(os.path.join(fixtures, "bench.pdf"), args.pdf_pages),
+        "image": lambda: make_image(os.path.join(fixtures, "bench.png")),
+        "docx": lambda: make_docx(os.path.join(fixtures, "bench.docx"), args.docx_paragraphs),
+    }
+
+    results = {}
+    for kind, build in builders.items():
+        # Images and PDF figures go through OCR, which needs the tesseract
+        # binary. Without it those formats are reported as skipped.
+        if kind in ("pdf", "image") and shutil.which("tesseract") is None:
+            results[kind] = {"skipped": "tesseract is not installed"}
+            continue
+        path = build()
+        runs = {"bytes": os.path.getsize(path)}
+        runs["cold"] = ingest_once(server, fakes, f"bench-ingest-{kind}", path)
+        runs["same_file"] = ingest_once(server, fakes, f"bench-ingest-{kind}", path)
+        runs["other_user"] = ingest_once(server, fakes, f"bench-ingest-{kind}-2", path)
+        if kind == "docx":
+            edited = make_docx(os.path.join(fixtures, "bench.docx"), args.docx_paragraphs, changed=args.docx_paragraphs // 2)
+            runs["one_paragraph_changed"] = ingest_once(server, fakes, f"bench-ingest-{kind}", edited)
+        results[kind] = runs
+    return results
+
+
+def stream_turn(server, **kwargs) -> dict:
+    started = time.perf_counter()
+    first = None
+    frames = 0
+    chars = 0
+    for frame in server.invoke_stream(**kwargs):
+        if first is None:
+            first = time.perf_counter() - started
+        frames += 1
+        chars += len(frame)
+    return {"ttft": first or 0.0, "total": time.perf_counter() - started, "frames": frames, "chars": chars}
+
+def bench_ttft(server, fakes, args) -> dict:
+    # The first turn of each user builds the agent (and provisions the index),
+    # it is reported apart from the steady-state turns
+    selection = sentences(random.Random(1), 4)
+    turns = {
+        "chat": {"question": "What does the agreement say about payment?"},
+        "create_document": {"question": "Write a short service agreement for a consultant"},
+        "edit_section": {
+            "question": "Edit this section to sound more formal",
+            "start": "0", "end": str(len(" ".join(selection))), "content": selection,
+        },
+    }
+
+    results = {}
+    for name, turn in turns.items():
+        user_id = f"bench-ttft-{name}"
+        kwargs = {"user_id": user_id, "file_path": "", "start": None, "end": None, "content": None, **turn}
+        first_turn = stream_turn(server, **kwargs)
+        runs = [stream_turn(server, **kwargs) for _ in range(args.turns)]
+        results[name] = {
+            "intent": server.classify_intent(turn["question"]),
+            "first_turn": {"ttft_ms": round(first_turn["ttft"] * 1000, 3), "total_ms": round(first_turn["total"] * 1000, 3)},
+            "ttft": summarize([run["ttft"] for run in runs]),
+            "total": summarize([run["total"] for run in runs]),
+            "frames_per_turn": runs[-1]["frames"] if runs else first_turn["frames"],
+            "chars_per_turn": runs[-1]["chars"] if runs else first_turn["chars"],
+        }
+    return results
+
+
+def bench_intent(server, fakes, args) -> dict:
+    from api.intent import IntentClassifier, INTENT_EXAMPLES
+    prompts = [text for examples in INTENT_EXAMPLES.values() for text in examples]
+    prompts += [
+        "accept", "Yes, apply it.", "reject the change", "download it please",
+        "Could you export this as a PDF?", "Tighten the wording of the second paragraph",
+        "What are the notice requirements in this agreement?", "Draft a privacy policy for a mobile app",
+    ]
+
+    classifier = IntentClassifier(server.embeddings, fakes["llm"])
+    started = time.perf_counter()
+    classifier.classify(prompts[0])
+    first_call = time.perf_counter() - started
+
+    cold = []
+    for prompt in prompts[1:]:
+        started = time.perf_counter()
+        classifier.classify(prompt)
+        cold.append(time.perf_counter() - started)
+    cold_counts = dict(classifier.counts)
+
+    warm = []
+    for prompt in prompts:
+        started = time.perf_counter()
+        classifier.classify(prompt.upper())
+        warm.append(time.perf_counter() - started)
+
+    return {
+        "prompts": len(prompts),
+        "first_call_ms": round(first_call * 1000, 3),
+        "cold": summarize(cold),
+        "warm": summarize(warm),
+        "sources": cold_counts,
+        "llm_first_token_ms": fakes["llm"].first_token_latency * 1000,
+    }
+
+
+def bench_concurrency(server, fakes, args) -> dict:
+    from api.index import app
+
+    def request(i: int) -> dict:
+        client = app.test_client()
+        started = time.perf_counter()
+        first = None
+        response = client.post(
+            "/api/chat",
+            data={"question": "What does the agreement say about payment?", "user_id": f"bench-user-{i % args.users}"},
+            buffered=False,
+        )
+        try:
+            for chunk in response.iter_encoded():
+                if first is None and chunk:
+                    first = time.perf_counter() - started
+        finally:
+            response.close()
+        return {"status": response.status_code, "ttfb": first or 0.0, "total": time.perf_counter() - started}
+
+    # Agents and indexes are built once per user before the clock starts
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(request, range(args.users)))
+
+        started = time.perf_counter()
+        results = list(pool.map(request, range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    ok = [result for result in results if result["status"] == 200]
+    if len(ok) < len(results):
+        raise RuntimeError(f"{len(results) - len(ok)} of {len(results)} requests failed")
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "concurrency": args.concurrency,
+        "users": args.users,
+        "requests_per_second": round(len(results) / max(elapsed, 1e-9), 3),
+        "ttfb": summarize([result["ttfb"] for result in ok]),
+        "total": summarize([result["total"] for result in ok]),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--vector-backend", choices=["pinecone", "local"], default="pinecone")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300)
+    parser.add_argument("--llm-token-ms", type=float, default=10)
+    parser.add_argument("--embed-ms", type=float, default=100)
+    parser.add_argument("--embed-per-text-ms", type=float, default=0.5)
+    parser.add_argument("--pinecone-ms", type=float, default=30)
+    parser.add_argument("--provision-ms", type=float, default=0)
+    parser.add_argument("--pdf-pages", type=int, default=30)
+    parser.add_argument("--docx-paragraphs", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=8)
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    args.workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="chatbot-bench-"))
+    os.makedirs(args.workdir, exist_ok=True)
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+
+    # The service logs with print, keep stdout for the report
+    failed = []
+    with contextlib.redirect_stdout(sys.stderr):
+        server, fakes = setup(args)
+        runners = {"ingestion": bench_ingestion, "ttft": bench_ttft, "intent": bench_intent, "concurrency": bench_concurrency}
+        for name in scenarios:
+            started = time.perf_counter()
+            try:
+                report["results"][name] = runners[name](server, fakes, args)
+            except Exception as e:
+                # Keep running the other scenarios, but the run as a whole fails
+                traceback.print_exc()
+                report["results"][name] = {"error": repr(e)}
+                failed.append(name)
+            report["results"][name]["seconds"] = round(time.perf_counter() - started, 3)
+
+        report["backends"] = {
+            "pinecone": fakes["pc"].stats(),
+            "embedding_api": {"calls": fakes["embeddings"].calls, "texts": fakes["embeddings"].texts},
+            "embedding_cache": server.embeddings.stats(),
+            "agent_cache": server.agent_cache.stats(),
+        }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    if failed:
+        print(f"Benchmark scenarios failed: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from api.local_vector_store import LocalVectorStore
+
+# Ingestion and query cost of the local vector store at a given size:
+#   python -m benchmarks.bench_local_vectors --rows 1000,10000,50000
+
+
+def percentile_ms(seconds: list[float], q: float) -> float:
+    return round(float(np.percentile(seconds, q)) * 1000, 3)
+
+def run(rows: int, args) -> dict:
+    rng = np.random.default_rng(0)
+    folder = tempfile.mkdtemp(prefix="bench-vectors-")
+    try:
+        store = LocalVectorStore(None, folder)
+        started = time.perf_counter()
+        for start in range(0, rows, args.batch):
+            count = min(args.batch, rows - start)
+            ids = [f"chunk-{i}" for i in range(start, start + count)]
+            metadatas = [{"source": f"file-{i % 20}"} for i in range(start, start + count)]
+            vectors = rng.normal(size=(count, args.dimension)).astype(np.float32)
+            store.add_embeddings(ids, vectors, metadatas, ids)
+        ingest = time.perf_counter() - started
+
+        queries = rng.normal(size=(args.queries, args.dimension)).astype(np.float32)
+        timings = {"query": [], "query_filtered": []}
+        for query in queries:
+            for name, filter in (("query", None), ("query_filtered", {"source": "file-3"})):
+                started = time.perf_counter()
+                store.similarity_search_by_vector_with_score(query, k=4, filter=filter)
+                timings[name].append(time.perf_counter() - started)
+
+        stats = store.stats()
+        result = {
+            "rows": rows,
+            "ingest_seconds": round(ingest, 3),
+            "rows_written_per_row": round(stats["rows_written"] / rows, 2),
+            "segments": stats["segments"],
+            "compactions": stats["compactions"],
+        }
+        for name, seconds in timings.items():
+            result[name] = {"p50_ms": percentile_ms(seconds, 50), "p99_ms": percentile_ms(seconds, 99)}
+        return result
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="1000,10000,50000")
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--batch", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    results = [run(int(rows), args) for rows in args.rows.split(",") if rows]
+    print(json.dumps({"dimension": args.dimension, "batch": args.batch, "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import json
+import time
+import random
+import argparse
+from api.stream_output import MarkerParser, FrameCoalescer
+
+# Microbenchmarks for the streaming output stage:
+#   python -m benchmarks.bench_stream_output --tokens 20000
+
+
+def make_chunks(tokens: int, seed: int = 0, whole_markers: bool = False) -> list[str]:
+    # Model-like output: a short preamble, a long document between --- markers
+    # and a closing question, cut into 1-6 character tokens. With whole_markers
+    # every marker is its own token, the only shape the naive loop understands.
+    rng = random.Random(seed)
+    words = ["contract", "party", "shall", "agreement", "the", "of", "and", "term", "- item", "**bold**"]
+    body = []
+    size = 0
+    while size < tokens * 4:
+        line = " ".join(rng.choice(words) for _ in range(rng.randint(4, 14))) + "\n"
+        body.append(line)
+        size += len(line)
+    parts = ["Here is your document:\n", "---", "\n" + "".join(body), "---", "\nWould you like any changes?"]
+    if not whole_markers:
+        parts = ["".join(parts)]
+
+    chunks = []
+    for text in parts:
+        if text == "---":
+            chunks.append(text)
+            continue
+        pos = 0
+        while pos < len(text):
+            step = rng.randint(1, 6)
+            chunks.append(text[pos:pos + step])
+            pos += step
+    return chunks
+
+def naive(chunks: list[str]) -> dict:
+    # The previous loop: whole-chunk marker comparison, string += and one write per token
+    full_content = ""
+    writes = 0
+    documents = 0
+    doc_writing_flag = False
+    for content in chunks:
+        if "---" == content.strip() and doc_writing_flag:
+            doc_writing_flag = False
+            documents += 1
+            full_content = ""
+            writes += 1
+            continue
+        if doc_writing_flag:
+            full_content += content
+        elif "---" != content.strip():
+            writes += 1
+        if "---" == content.strip():
+            doc_writing_flag = True
+    return {"writes": writes, "documents": documents}
+
+def incremental(chunks: list[str], coalesce: bool) -> dict:
+    parser = MarkerParser()
+    frames = FrameCoalescer() if coalesce else None
+    writes = 0
+    documents = 0
+    for content in chunks:
+        for kind, text in parser.feed(content):
+            if kind == "document":
+                documents += 1
+                continue
+            if frames is None:
+                writes += 1
+            elif frames.push(text):
+                writes += 1
+    for kind, _ in parser.finish():
+        documents += kind == "document"
+    if frames is not None and frames.flush():
+        writes += 1
+    return {"writes": writes, "documents": documents}
+
+def coalesce_only(chunks: list[str]) -> dict:
+    # Plain chat answers skip the parser, only the write coalescing applies
+    frames = FrameCoalescer()
+    writes = sum(1 for content in chunks if frames.push(content))
+    if frames.flush():
+        writes += 1
+    return {"writes": writes, "documents": 0}
+
+def measure(fn, *args, repeat: int = 5) -> dict:
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return {"seconds": round(best, 6), **result}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for scenario, whole_markers in (("whole_markers", True), ("split_markers", False)):
+        chunks = make_chunks(args.tokens, whole_markers=whole_markers)
+        results[scenario] = {
+            "tokens": len(chunks),
+            "naive": measure(naive, chunks, repeat=args.repeat),
+            "parser": measure(incremental, chunks, False, repeat=args.repeat),
+            "parser_coalesced": measure(incremental, chunks, True, repeat=args.repeat),
+        }
+        for name in ("naive", "parser", "parser_coalesced"):
+            stats = results[scenario][name]
+            stats["tokens_per_second"] = round(len(chunks) / max(stats["seconds"], 1e-9))
+
+    chunks = [chunk for chunk in make_chunks(args.tokens) if chunk.strip() != "---"]
+    results["plain_chat"] = {
+        "tokens": len(chunks),
+        "per_token_writes": {"writes": len(chunks)},
+        "coalesced": measure(coalesce_only, chunks, repeat=args.repeat),
+    }
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
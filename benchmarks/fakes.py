@@ -0,0 +1,246 @@
+import re
+import json
+import time
+import threading
+from types import SimpleNamespace
+import numpy as np
+import xxhash
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+# Deterministic stand-ins for OpenAI and Pinecone. Latencies are simulated
+# with sleeps, so the numbers measure this service and not the network.
+
+_WORD = re.compile(r"\w+")
+
+
+class FakeEmbeddings(Embeddings):
+    # Hashed bag of words: texts that share words get similar vectors, so the
+    # intent centroids and retrieval behave roughly like the real model
+    def __init__(self, dimension: int = 3072, latency: float = 0.0, per_text_latency: float = 0.0):
+        self.dimension = dimension
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+        self.texts = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD.findall(text.lower()) or [""]:
+            h = xxhash.xxh64_intdigest(word)
+            vector[h % self.dimension] += 1.0 if (h >> 32) & 1 else -1.0
+            vector[(h >> 16) % self.dimension] += 0.5
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            self.calls += 1
+            self.texts += len(texts)
+        time.sleep(self.latency + self.per_text_latency * len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+class FakeChatModel(BaseChatModel):
+    # Answers the prompts server.py sends (intent classification, DOCX
+    # generation, JSON paragraph edits, plain chat) and streams the answer in
+    # small tokens. With tools bound, the first reply to a chat question is a
+    # retriever call, so the vector store query path is exercised too.
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    token_size: int = 4
+    reply_words: int = 120
+    tool_names: list[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"tool_names": [tool.name for tool in tools]})
+
+    def _reply(self, messages) -> dict:
+        last = messages[-1]
+        text = last.content if isinstance(last.content, str) else str(last.content)
+
+        if text.startswith("You are an intent classifier"):
+            message = text.rsplit("User message:", 1)[-1].lower()
+            for word, intent in (("download", "download_document"), ("export", "export_document"),
+                                 ("write", "create_document"), ("create", "create_document"),
+                                 ("edit", "edit_section"), ("change", "continue_editing")):
+                if word in message:
+                    return {"content": intent}
+            return {"content": "chat"}
+
+        if "Paragraph list: " in text:
+            paragraphs = json.loads(text.split("Paragraph list: ", 1)[1].split("\n", 1)[0])
+            revised = [paragraph + " (revised)" for paragraph in paragraphs]
+            return {"content": json.dumps(revised)}
+
+        if "between the --- and --- markers" in text:
+            body = "\n\n".join(f"## Section {i}\n\n" + self._words(i, 60) for i in range(1, 6))
+            return {"content": "Here is your document:\n---\n# Document\n\n" + body + "\n---\nAnything else?"}
+
+        if self.tool_names and isinstance(last, HumanMessage):
+            return {"tool_call": {"name": self.tool_names[0], "args": {"query": text[-200:]}, "id": f"call_{len(messages)}"}}
+
+        context = ""
+        if isinstance(last, ToolMessage):
+            context = f"Based on {len(last.content)} characters of context: "
+        return {"content": context + self._words(len(messages), self.reply_words)}
+
+    @staticmethod
+    def _words(seed: int, count: int) -> str:
+        words = ["the", "agreement", "party", "shall", "term", "notice", "payment", "clause", "document", "section"]
+        return " ".join(words[(seed * 7 + i * 3) % len(words)] for i in range(count)) + "."
+
+    def _tokens(self, text: str) -> list[str]:
+        return [text[i:i + self.token_size] for i in range(0, len(text), self.token_size)]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._reply(messages)
+        if "tool_call" in reply:
+            time.sleep(self.first_token_latency)
+            message = AIMessage(content="", tool_calls=[reply["tool_call"]])
+        else:
+            tokens = self._tokens(reply["content"])
+            time.sleep(self.first_token_latency + self.token_latency * max(len(tokens) - 1, 0))
+            message = AIMessage(content=reply["content"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        reply = self._reply(messages)
+        time.sleep(self.first_token_latency)
+        if "tool_call" in reply:
+            call = reply["tool_call"]
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+            ]))
+            return
+
+        for i, token in enumerate(self._tokens(reply["content"])):
+            if i:
+                time.sleep(self.token_latency)
+            # BaseChatModel reports each chunk to the callbacks (and so to
+            # stream_mode="messages") itself
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class _Done:
+    # What Index.upsert(async_req=True) returns
+    def __init__(self, result):
+        self._result = result
+
+    def get(self):
+        return self._result
+
+
+class FakeIndex:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        # langchain-pinecone reads the key and host off the index config
+        self.config = SimpleNamespace(host=f"{name}.fake", api_key="offline-benchmark")
+        self.calls = {"upsert": 0, "query": 0, "delete": 0}
+        self._lock = threading.Lock()
+        self._namespaces = {}
+
+    def _records(self, namespace):
+        return self._namespaces.setdefault(namespace or "", {})
+
+    def upsert(self, vectors, namespace=None, async_req=False, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["upsert"] += 1
+            records = self._records(namespace)
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    records[vector["id"]] = (vector["values"], vector.get("metadata") or {})
+                else:
+                    records[vector[0]] = (vector[1], vector[2] if len(vector) > 2 else {})
+        result = {"upserted_count": len(vectors)}
+        return _Done(result) if async_req else result
+
+    def query(self, vector, top_k: int = 4, namespace=None, include_metadata: bool = True, filter=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["query"] += 1
+            records = list(self._records(namespace).items())
+        if filter:
+            records = [(id, record) for id, record in records if all(record[1].get(k) == v for k, v in filter.items())]
+        if not records:
+            return {"matches": []}
+
+        matrix = np.asarray([record[0] for _, record in records], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+        best = np.argsort(scores)[::-1][:top_k]
+        return {"matches": [
+            {"id": records[i][0], "score": float(scores[i]), "metadata": dict(records[i][1][1]) if include_metadata else {}}
+            for i in best
+        ]}
+
+    def delete(self, ids=None, namespace=None, delete_all: bool = False, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["delete"] += 1
+            records = self._records(namespace)
+            if delete_all:
+                records.clear()
+            for id in ids or []:
+                records.pop(id, None)
+        return {}
+
+    def count(self, namespace=None) -> int:
+        with self._lock:
+            return len(self._records(namespace))
+
+
+class FakePinecone:
+    # The slice of the Pinecone client IndexRegistry uses. New indexes become
+    # ready after provision_delay seconds.
+    def __init__(self, latency: float = 0.0, provision_delay: float = 0.0):
+        self.latency = latency
+        self.provision_delay = provision_delay
+        self.calls = {"list_indexes": 0, "create_index": 0, "describe_index": 0}
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._ready_at = {}
+
+    def list_indexes(self):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["list_indexes"] += 1
+            return [{"name": name} for name in self._indexes]
+
+    def create_index(self, name: str, dimension: int, metric: str = "cosine", spec=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["create_index"] += 1
+            if name not in self._indexes:
+                self._indexes[name] = FakeIndex(name, latency=self.latency)
+                self._ready_at[name] = time.monotonic() + self.provision_delay
+
+    def describe_index(self, name: str):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls["describe_index"] += 1
+            return SimpleNamespace(name=name, status={"ready": time.monotonic() >= self._ready_at[name]})
+
+    def Index(self, name: str):
+        with self._lock:
+            return self._indexes[name]
+
+    def stats(self) -> dict:
+        with self._lock:
+            index_calls = {}
+            for index in self._indexes.values():
+                for call, count in index.calls.items():
+                    index_calls[call] = index_calls.get(call, 0) + count
+            return {"indexes": len(self._indexes), **self.calls, **index_calls}
@@ -0,0 +1,33 @@
+import threading
+from api.conversation_memory import ConversationStore
+
+
+def test_two_workers_append_to_one_thread(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    first = ConversationStore(path=path)
+    second = ConversationStore(path=path)
+
+    first.append("user", "human", "question one")
+    second.append("user", "ai", "answer one")
+    first.append("user", "human", "question two")
+
+    for store in (first, second):
+        assert [message.content for message in store.history("user")] == ["question one", "answer one", "question two"]
+
+
+def test_concurrent_appends_get_distinct_seqs(tmp_path):
+    path = str(tmp_path / "conversations.sqlite3")
+    stores = [ConversationStore(path=path) for _ in range(4)]
+
+    def worker(store, n):
+        for i in range(25):
+            store.append("user", "human", f"{n}-{i}")
+
+    threads = [threading.Thread(target=worker, args=(store, n)) for n, store in enumerate(stores)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stores[0].thread_stats("user")["messages"] == 100
+    assert len(stores[1].history("user", budget=10 ** 6)) == 100
@@ -0,0 +1,40 @@
+import os
+import pytest
+from docx import Document as DocxDocument
+from api.docx_cache import DocxCache
+
+
+def make_docx(path, texts):
+    doc = DocxDocument()
+    for text in texts:
+        doc.add_paragraph(text)
+    doc.save(path)
+
+
+def test_apply_edits_writes_and_keeps_cache_in_step(tmp_path):
+    path = str(tmp_path / "contract.docx")
+    make_docx(path, ["one", "two"])
+    cache = DocxCache()
+
+    assert cache.apply_edits(path, [{"para_idx": 1, "new_text": "TWO"}]) == 1
+    assert cache.paragraphs(path) == ["one", "TWO"]
+    assert [p.text for p in DocxDocument(path).paragraphs] == ["one", "TWO"]
+    assert cache.parses == 1
+
+
+def test_failed_save_does_not_leave_edits_in_cache(tmp_path, monkeypatch):
+    path = str(tmp_path / "contract.docx")
+    make_docx(path, ["one", "two"])
+    cache = DocxCache()
+    assert cache.paragraphs(path) == ["one", "two"]
+
+    def fail(src, dst):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "replace", fail)
+    with pytest.raises(OSError):
+        cache.apply_edits(path, [{"para_idx": 1, "new_text": "TWO"}])
+    monkeypatch.undo()
+
+    assert cache.paragraphs(path) == ["one", "two"]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,22 @@
+import os
+from api.downloads_store import DownloadsStore
+
+
+def test_link_current_same_version_repeatedly(tmp_path):
+    store = DownloadsStore(folder=str(tmp_path))
+    filename = store.put(b"same document")
+    for _ in range(3):
+        current = store.link_current("user", filename)
+
+    assert os.path.samefile(store.path(current), store.path(filename))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_save_current_replaces_previous_version(tmp_path):
+    store = DownloadsStore(folder=str(tmp_path))
+    for data in (b"first", b"first", b"second", b"second"):
+        current = store.save_current("user", data)
+
+    with open(store.path(current), "rb") as f:
+        assert f.read() == b"second"
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
@@ -0,0 +1,71 @@
+import json
+import threading
+import pytest
+from api.edit_engine import EditEngine, pack_batches, parse_batch
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+class Reply:
+    def __init__(self, content: str):
+        self.content = content
+
+
+class FlakyEditor:
+    # Upper-cases every paragraph. A batch holding "flaky" comes back short
+    # once, a batch holding "broken" never comes back as valid JSON.
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def invoke(self, messages):
+        prompt = messages[0].content
+        paragraphs = json.loads(prompt.split("Paragraph list: ", 1)[1])
+        key = paragraphs[0]
+        with self._lock:
+            self.calls[key] = self.calls.get(key, 0) + 1
+            attempt = self.calls[key]
+        if "broken" in key:
+            return Reply("Sorry, I cannot help with that.")
+        if "flaky" in key and attempt == 1:
+            return Reply(json.dumps([p.upper() for p in paragraphs[:-1]]))
+        return Reply("```json\n" + json.dumps([p.upper() for p in paragraphs]) + "\n```")
+
+
+def test_pack_batches_respects_budget_and_order():
+    paragraphs = ["a b c", "d e", "f", "g h i j k l m n o p", "q"]
+    # Each paragraph costs its words plus 2
+    assert pack_batches(paragraphs, count_words, budget=9) == [(0, 2), (2, 3), (3, 4), (4, 5)]
+    assert pack_batches(paragraphs, count_words, budget=1000) == [(0, 5)]
+    assert pack_batches([], count_words, budget=9) == []
+
+
+def test_parse_batch_accepts_fences_and_rejects_bad_shapes():
+    assert parse_batch('```json\n["a", "b"]\n```', 2) == ["a", "b"]
+    assert parse_batch('---["a"]---', 1) == ["a"]
+    with pytest.raises(ValueError):
+        parse_batch('["a"]', 2)
+    with pytest.raises(ValueError):
+        parse_batch('{"a": 1}', 1)
+    with pytest.raises(ValueError):
+        parse_batch("not json", 1)
+
+
+def test_failing_batches_are_retried_or_left_unchanged():
+    paragraphs = ["first one", "flaky two", "broken three", "last four"]
+    llm = FlakyEditor()
+    # Budget of 4 tokens puts every paragraph in a batch of its own
+    engine = EditEngine(llm, count_words, batch_tokens=4, workers=4, retries=2)
+
+    results = list(engine.stream("shout", paragraphs))
+
+    assert results == [
+        (0, ["FIRST ONE"], True),
+        (1, ["FLAKY TWO"], True),
+        (2, ["broken three"], False),
+        (3, ["LAST FOUR"], True),
+    ]
+    assert llm.calls == {"first one": 1, "flaky two": 2, "broken three": 3, "last four": 1}
+    assert engine.stats() == {"batches": 4, "retries": 3, "failed": 1}
@@ -0,0 +1,65 @@
+from langchain_core.embeddings import Embeddings
+from api.embedding_cache import CachedEmbeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return [[float(len(text)), 1.0, 0.0, 0.0] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def stored_bytes(cache: CachedEmbeddings) -> int:
+    return cache._db.execute("SELECT SUM(size) FROM embeddings").fetchone()[0]
+
+
+def test_rewriting_a_cached_vector_keeps_the_byte_count(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    first = CachedEmbeddings(CountingEmbeddings(), model="fake", path=path)
+    second = CachedEmbeddings(CountingEmbeddings(), model="fake", path=path)
+
+    # Both workers miss, then both store the same texts
+    texts = ["payment terms", "termination clause"]
+    keys = [first._key(text) for text in texts]
+    vectors = first.underlying.embed_documents(texts)
+    with first._lock:
+        first._store(list(zip(keys, vectors)))
+        first._db.commit()
+    second.embed_documents(texts)
+    with first._lock:
+        first._store(list(zip(keys, vectors)))
+        first._db.commit()
+
+    assert first.stats()["disk_bytes"] == stored_bytes(first)
+
+
+def test_eviction_recounts_before_dropping(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = CachedEmbeddings(CountingEmbeddings(), model="fake", path=path, max_bytes=10 ** 6)
+    cache.embed_documents([f"text {i}" for i in range(10)])
+    size = stored_bytes(cache)
+
+    # A stale count over the cap must not evict rows that fit
+    cache._total_bytes = cache.max_bytes + 1
+    with cache._lock:
+        cache._evict()
+    assert cache.evictions == 0
+    assert cache.stats()["disk_bytes"] == size
+
+
+def test_memory_tier_keeps_compact_arrays(tmp_path):
+    cache = CachedEmbeddings(CountingEmbeddings(), model="fake", path=str(tmp_path / "embeddings.sqlite3"))
+    miss = cache.embed_documents(["payment terms"])
+    hit = cache.embed_documents(["payment terms"])
+
+    assert miss == hit
+    assert all(type(value) is float for value in hit[0])
+    assert cache.underlying.texts == 1
+    (vector,) = cache._memory.values()
+    assert vector.dtype == cache.dtype
+    assert cache.stats()["memory_bytes"] == 4 * cache.dtype.itemsize
@@ -0,0 +1,25 @@
+import multiprocessing
+import os
+from api.ingest import user_lock, load_manifest, save_manifest
+
+
+def add_documents(prefix: str, count: int):
+    for i in range(count):
+        with user_lock("user"):
+            manifest = load_manifest("user", "index")
+            manifest["documents"][f"{prefix}-{i}"] = {"chunks": []}
+            save_manifest("user", "index", manifest)
+
+
+def test_manifest_updates_from_two_processes_are_not_lost(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=add_documents, args=(prefix, 30)) for prefix in ("a", "b")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    assert len(load_manifest("user", "index")["documents"]) == 60
+    assert not [name for name in os.listdir("data/manifests") if name.endswith(".tmp")]
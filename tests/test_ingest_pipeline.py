@@ -0,0 +1,119 @@
+import threading
+from langchain_core.documents import Document
+from api import ingest_pipeline
+from api.ingest_pipeline import start_ingest
+
+
+class RecordingStore:
+    def __init__(self):
+        self.ids = set()
+        self.metadatas = []
+
+    def add_embeddings(self, texts, vectors, metadatas=None, ids=None):
+        self.ids.update(ids)
+        self.metadatas.extend(metadatas)
+
+    def delete(self, ids=None):
+        self.ids.difference_update(ids)
+
+
+class StaticEmbeddings:
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+
+def ingest(store, index_key: str, texts: list[str], file_hash: str, embeddings=None):
+    job = start_ingest(
+        "user", "contract.pdf", index_key,
+        loader=lambda: [[Document(page_content=text)] for text in texts],
+        splitter=lambda docs: docs,
+        get_store=lambda: store,
+        embeddings=embeddings or StaticEmbeddings(),
+        file_hash=file_hash,
+    )
+    assert job.wait(10)
+    assert job.status == "done", job.error
+    return job
+
+
+def test_same_file_is_indexed_once_per_index(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first, second = RecordingStore(), RecordingStore()
+    texts = ["payment terms", "termination clause"]
+
+    assert ingest(first, "pinecone/a/", texts, "hash-1").upserted == 2
+    assert ingest(first, "pinecone/a/", texts, "hash-1").upserted == 0
+    # A new index or namespace starts empty, the same bytes are indexed again
+    assert ingest(second, "pinecone/shared/user", texts, "hash-1").upserted == 2
+    assert len(second.ids) == 2
+
+
+def test_changed_file_only_sends_the_difference(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = RecordingStore()
+    ingest(store, "local/x", ["payment terms", "termination clause"], "hash-1")
+
+    job = ingest(store, "local/x", ["payment terms", "governing law"], "hash-2")
+    assert (job.upserted, job.deleted, job.unchanged) == (1, 1, 1)
+    assert len(store.ids) == 2
+
+
+def test_embedding_starts_before_extraction_finishes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ingest_pipeline, "EMBED_BATCH_SIZE", 1)
+    embedded = threading.Event()
+
+    class SignallingEmbeddings(StaticEmbeddings):
+        def embed_documents(self, texts):
+            embedded.set()
+            return super().embed_documents(texts)
+
+    def loader():
+        yield [Document(page_content="first page")]
+        # The first page is embedded while the second is still being extracted
+        assert embedded.wait(5)
+        yield [Document(page_content="second page")]
+
+    def label(chunks):
+        for i, chunk in enumerate(chunks):
+            chunk.metadata["position"] = i
+        return chunks
+
+    store = RecordingStore()
+    job = start_ingest(
+        "user", "report.pdf", "local/x", loader=loader, splitter=lambda docs: docs,
+        get_store=lambda: store, embeddings=SignallingEmbeddings(), label=label,
+    )
+    assert job.wait(10)
+    assert job.status == "done", job.error
+    assert (job.chunks, job.embedded, job.upserted) == (2, 2, 2)
+    assert store.metadatas == [{"position": 0}, {"position": 1}]
+
+
+def test_pinecone_store_gets_each_chunk_embedded_once(tmp_path, monkeypatch):
+    from langchain_pinecone import PineconeVectorStore
+    from benchmarks.fakes import FakeIndex
+    monkeypatch.chdir(tmp_path)
+
+    class CountingEmbeddings(StaticEmbeddings):
+        def __init__(self):
+            self.texts = 0
+
+        def embed_documents(self, texts):
+            self.texts += len(texts)
+            return super().embed_documents(texts)
+
+        def embed_query(self, text):
+            return self.embed_documents([text])[0]
+
+    embeddings = CountingEmbeddings()
+    index = FakeIndex("user-index")
+    store = PineconeVectorStore(index=index, embedding=embeddings, namespace="user")
+    job = ingest(store, "pinecone/user-index/user", ["payment terms", "termination clause"], "hash-1", embeddings)
+
+    # Not again for the upsert, and not by the store
+    assert job.upserted == 2
+    assert embeddings.texts == 2
+    assert index.count(namespace="user") == 2
+    texts = sorted(record[1]["text"] for record in index._records("user").values())
+    assert texts == ["payment terms", "termination clause"]
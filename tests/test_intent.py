@@ -0,0 +1,26 @@
+import pytest
+from api.intent import IntentClassifier, _normalize_prompt
+
+
+@pytest.mark.parametrize("prompt, intent", [
+    ("Export", "export_document"),
+    ("export this as a PDF", "export_document"),
+    ("Please export the document to markdown.", "export_document"),
+    ("download", "download_document"),
+    ("Download it please!", "download_document"),
+    ("download the docx", "download_document"),
+    ("Accept", "accept_change"),
+    ("no, reject the changes", "reject_change"),
+])
+def test_rules_match_short_commands(prompt, intent):
+    assert IntentClassifier(None, None)._by_rules(_normalize_prompt(prompt)) == intent
+
+
+@pytest.mark.parametrize("prompt", [
+    "Write a section on export controls for the contract",
+    "What does the agreement say about the download limits?",
+    "Can you explain how exporting works in this app?",
+    "Apply a formal tone to this paragraph",
+])
+def test_rules_leave_other_messages_to_the_classifier(prompt):
+    assert IntentClassifier(None, None)._by_rules(_normalize_prompt(prompt)) is None
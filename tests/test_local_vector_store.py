@@ -0,0 +1,41 @@
+import numpy as np
+from api import local_vector_store
+from api.local_vector_store import LocalVectorStore
+
+
+def vectors(count: int, seed: int, dimension: int = 8):
+    return np.random.default_rng(seed).normal(size=(count, dimension)).astype(np.float32)
+
+
+def test_compaction_merges_similar_sizes(tmp_path):
+    store = LocalVectorStore(None, str(tmp_path))
+    batches = 64
+    for i in range(batches):
+        ids = [f"doc-{i}-{j}" for j in range(10)]
+        store.add_embeddings([f"text {vid}" for vid in ids], vectors(10, i), ids=ids)
+
+    stats = store.stats()
+    assert stats["rows"] == batches * 10
+    # Every row is rewritten once per tier, not once per compaction
+    assert stats["rows_written"] <= batches * 10 * 4
+    assert stats["segments"] < local_vector_store.MERGE_WIDTH * 4
+
+
+def test_deletes_and_replacements_survive_compaction_and_reload(tmp_path):
+    store = LocalVectorStore(None, str(tmp_path))
+    ids = [f"doc-{i}" for i in range(40)]
+    data = vectors(40, 0)
+    for start in range(0, 40, 5):
+        store.add_embeddings([f"v1 {vid}" for vid in ids[start:start + 5]], data[start:start + 5], ids=ids[start:start + 5])
+    store.delete(ids[:10])
+    store.add_embeddings(["v2 doc-20"], data[20:21], ids=["doc-20"])
+    for start in range(40, 80, 5):
+        more = [f"doc-{i}" for i in range(start, start + 5)]
+        store.add_embeddings(more, vectors(5, start), ids=more)
+
+    for opened in (store, LocalVectorStore(None, str(tmp_path))):
+        assert opened.get_by_ids(ids[:10]) == []
+        assert [doc.page_content for doc in opened.get_by_ids(["doc-20", "doc-30"])] == ["v2 doc-20", "v1 doc-30"]
+        assert opened.stats()["rows"] == 70
+        best, score = opened.similarity_search_by_vector_with_score(data[30], k=1)[0]
+        assert best.id == "doc-30" and score > 0.99
@@ -0,0 +1,72 @@
+import os
+import time
+import pytest
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    # The server keeps its stores under ./data, so it is imported from a
+    # scratch directory with the offline stand-ins for OpenAI and Pinecone
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("server"))
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    os.environ.setdefault("PINECONE_API_KEY", "test")
+    try:
+        from api import server
+        from benchmarks.fakes import FakeChatModel, FakeEmbeddings, FakePinecone
+        server.use_backends(chat_model=FakeChatModel(), embedding=FakeEmbeddings(dimension=64), pinecone_client=FakePinecone())
+        yield server
+    finally:
+        os.chdir(cwd)
+
+
+def stream_edit(server, monkeypatch, paragraphs: list[str], batch_tokens: int) -> list[str]:
+    monkeypatch.setattr(server, "classify_intent", lambda question: "edit_section")
+    monkeypatch.setattr(server.edit_engine, "batch_tokens", batch_tokens)
+    return list(server.invoke_stream(
+        question="Make this more formal", user_id="editor", file_path="",
+        start="0", end="10", content=paragraphs,
+    ))
+
+
+@pytest.mark.parametrize("batch_tokens", [10 ** 6, 8])
+def test_edit_stream_sends_every_revised_paragraph(server, monkeypatch, batch_tokens):
+    paragraphs = [f"Paragraph number {i} of the section." for i in range(6)]
+    frames = stream_edit(server, monkeypatch, paragraphs, batch_tokens)
+    reply = "".join(frames)
+
+    for paragraph in paragraphs:
+        assert f"{paragraph} (revised)" in reply
+    assert reply.index("(revised)") < reply.index("Would you like to accept or reject this change?")
+    assert "Apply your change(" in reply
+    if batch_tokens < 100:
+        # Each batch is its own frame, sent as soon as it is ready
+        assert len(frames) > 2
+
+
+def test_download_link_of_unterminated_document_is_sent(server, monkeypatch):
+    from benchmarks.fakes import FakeChatModel
+
+    class UnterminatedDocument(FakeChatModel):
+        # The model forgets the closing marker, the document ends with the reply
+        def _reply(self, messages):
+            reply = super()._reply(messages)
+            if "content" in reply:
+                reply["content"] = reply["content"].replace("\n---\nAnything else?", "\nEnd of document.")
+            return reply
+
+    def slow_save(content, user_id):
+        time.sleep(0.1)
+        return "http://localhost:5000/downloads/doc.docx"
+
+    monkeypatch.setattr(server, "llm", UnterminatedDocument())
+    monkeypatch.setattr(server, "agent_cache", server.AgentCache())
+    monkeypatch.setattr(server, "classify_intent", lambda question: "create_document")
+    monkeypatch.setattr(server, "save_docx_file", slow_save)
+    reply = "".join(server.invoke_stream(
+        question="Write a short agreement", user_id="writer", file_path="", start=None, end=None, content=None,
+    ))
+
+    assert reply.startswith("Here is your document:")
+    assert "[📄 Download your DOCX](http://localhost:5000/downloads/doc.docx)" in reply
+    assert "End of document." not in reply
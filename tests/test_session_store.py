@@ -0,0 +1,45 @@
+import threading
+from api.session_store import SqliteSessionStore
+
+
+def test_concurrent_updates_from_two_stores_are_not_lost(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    stores = [SqliteSessionStore(path=path), SqliteSessionStore(path=path)]
+
+    def worker(store, key):
+        for _ in range(50):
+            store.update(key, lambda value: (value or 0) + 1)
+
+    threads = [
+        threading.Thread(target=worker, args=(store, key))
+        for store in stores for key in ("pending_edit:a", "pending_edit:b") for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stores[0].get("pending_edit:a") == 200
+    assert stores[1].get("pending_edit:b") == 200
+
+
+def test_reads_do_not_wait_for_another_key(tmp_path):
+    store = SqliteSessionStore(path=str(tmp_path / "sessions.sqlite3"))
+    store.set("pending_edit:a", {"content": ["x"]})
+    inside = threading.Event()
+    release = threading.Event()
+
+    def slow(value):
+        inside.set()
+        release.wait(5)
+        return value
+
+    writer = threading.Thread(target=store.update, args=("pending_edit:b", slow))
+    writer.start()
+    assert inside.wait(5)
+    try:
+        # Another user's read goes through while b's update is in progress
+        assert store.get("pending_edit:a") == {"content": ["x"]}
+    finally:
+        release.set()
+        writer.join()
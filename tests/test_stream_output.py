@@ -0,0 +1,82 @@
+from api import stream_output
+from api.stream_output import FrameCoalescer, MarkerParser
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_first_piece_is_sent_at_once(monkeypatch):
+    monkeypatch.setattr(stream_output.time, "monotonic", Clock())
+    frames = FrameCoalescer(max_bytes=256, max_delay=0.05)
+
+    assert frames.push("Hel") == "Hel"
+    assert frames.push("lo") is None
+    assert frames.flush() == "lo"
+
+
+def test_frames_follow_size_and_time_since_last_frame(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(stream_output.time, "monotonic", clock)
+    frames = FrameCoalescer(max_bytes=8, max_delay=0.05)
+    frames.push("a")
+
+    clock.now += 0.01
+    assert frames.push("b") is None
+    assert frames.push("cdefghi") == "bcdefghi"
+
+    # After a pause the next piece goes out with whatever was waiting
+    clock.now += 0.02
+    assert frames.push("j") is None
+    clock.now += 1.0
+    assert frames.push("k") == "jk"
+    assert frames.frames == 3
+
+
+def parse(chunks: list[str]) -> list:
+    parser = MarkerParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.finish())
+    # Adjacent text events are one piece of text to the client
+    merged = []
+    for kind, text in events:
+        if merged and kind == "text" and merged[-1][0] == "text":
+            merged[-1] = ("text", merged[-1][1] + text)
+        else:
+            merged.append((kind, text))
+    return merged
+
+
+def test_marker_split_across_chunks():
+    events = parse(["Here it is:\n-", "-", "-\n# Title\nBody\n--", "-\nAnything else?"])
+    assert events == [("text", "Here it is:\n"), ("document", "# Title\nBody\n"), ("text", "Anything else?")]
+
+
+def test_dash_prefix_is_held_then_released_as_text():
+    parser = MarkerParser()
+    assert parser.feed("Intro\n-") == [("text", "Intro\n")]
+    assert parser.feed("-") == []
+    # "-- item" can no longer become a marker, so the held dashes go out
+    assert parser.feed(" item\n") == [("text", "-- item\n")]
+    assert not parser.inside
+
+
+def test_unterminated_document_is_handed_over_on_finish():
+    assert parse(["Draft:\n---\n# Title\n", "Body"]) == [("text", "Draft:\n"), ("document", "# Title\nBody")]
+    # An opening marker with nothing after it is not a document
+    assert parse(["Draft:\n---\n"]) == [("text", "Draft:\n")]
+
+
+def test_dashes_mid_line_are_text():
+    events = parse(["Costs --- fees and ---\n", "a---b\n"])
+    assert events == [("text", "Costs --- fees and ---\na---b\n")]
+
+
+def test_marker_as_the_last_chunk_closes_the_document():
+    assert parse(["---\nBody\n", "---"]) == [("document", "Body\n")]